@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Positions, cash, P&L and turnover of each player over a binary deal log,
+computed on NumPy columns.
+
+    python analytics.py deal.log
+
+Each deal is two legs: the buyer's and the seller's. The legs are sorted by
+player (then by deal), so the path of a player is a slice, and the running
+totals of all players are one cumsum, restarted at the start of each player.
+"""
+
+from deallog import MAGIC, RECORD, read_players
+import argparse
+import numpy as np
+
+# Same layout as RECORD
+DEAL_DTYPE = np.dtype([
+    ("tick", "<i8"),
+    ("buyer", "<u4"),
+    ("seller", "<u4"),
+    ("n_stock", "<i8"),
+    ("price", "<f8"),
+    ("buyer_money", "<f8"),
+    ("buyer_n_stock", "<i8"),
+    ("seller_money", "<f8"),
+    ("seller_n_stock", "<i8"),
+])
+assert DEAL_DTYPE.itemsize == RECORD.size
+
+def load_deals(file_name):
+    """All records of a binary deal log, as a structured array"""
+    with open(file_name, 'rb') as f:
+        assert f.read(len(MAGIC)) == MAGIC, f"{file_name} is not a binary deal log"
+        return np.fromfile(f, dtype=DEAL_DTYPE)
+
+def default_strategy(player_id):
+    """rand_12 -> rand. The player_id without its number."""
+    return player_id.rsplit("_", 1)[0]
+
+def grouped_cumsum(values, starts):
+    """cumsum of values, restarted at each index in starts (starts[0] is 0)"""
+    total = np.cumsum(values)
+    offsets = total[starts] - values[starts]
+    lengths = np.diff(np.append(starts, len(values)))
+    return total - np.repeat(offsets, lengths)
+
+class DealHistory:
+    """
+    The legs of all deals, grouped by player.
+
+    player_ids[p] is the player_id of player index p, and
+    legs[starts[p]:ends[p]] are the legs of the player, in deal order.
+    Leg columns: player, deal, tick, price, n_stock (+ buy, - sell),
+    cash (the change of money), position and money (after the deal, from the log).
+    """
+    def __init__(self, file_name, strategy_of=default_strategy):
+        deals = load_deals(file_name)
+        names = read_players(file_name)
+        self.n_deal = len(deals)
+        self.last_price = deals["price"][-1] if len(deals) else np.nan
+
+        n_stock = deals["n_stock"]
+        value = n_stock * deals["price"]
+        handles = np.concatenate((deals["buyer"], deals["seller"]))
+        deal = np.concatenate((np.arange(len(deals)), np.arange(len(deals))))
+
+        handle_values, player = np.unique(handles, return_inverse=True)
+        self.player_ids = [names[int(handle)] for handle in handle_values]
+        self.strategies = [strategy_of(player_id) for player_id in self.player_ids]
+
+        order = np.lexsort((deal, player))
+        self.player = player[order]
+        self.deal = deal[order]
+        self.tick = np.concatenate((deals["tick"], deals["tick"]))[order]
+        self.price = np.concatenate((deals["price"], deals["price"]))[order]
+        self.n_stock = np.concatenate((n_stock, -n_stock))[order]
+        self.cash = np.concatenate((-value, value))[order]
+        self.position = np.concatenate((deals["buyer_n_stock"], deals["seller_n_stock"]))[order]
+        self.money = np.concatenate((deals["buyer_money"], deals["seller_money"]))[order]
+
+        n_player = len(self.player_ids)
+        self.starts = np.searchsorted(self.player, np.arange(n_player))
+        self.ends = np.append(self.starts[1:], len(self.player))
+
+    def position_path(self, player_id):
+        """(tick, position after the deal) of a player"""
+        p = self.player_ids.index(player_id)
+        legs = slice(self.starts[p], self.ends[p])
+        return self.tick[legs], self.position[legs]
+
+    def cash_path(self, player_id):
+        """(tick, money after the deal) of a player"""
+        p = self.player_ids.index(player_id)
+        legs = slice(self.starts[p], self.ends[p])
+        return self.tick[legs], self.money[legs]
+
+    def pnl_paths(self):
+        """
+        Realized and unrealized P&L after each leg, by average prices.
+        realized: the matched volume min(bought, sold) times (average sell - average buy).
+        unrealized: the open volume bought - sold, marked at the price of the leg.
+        Their sum is the cash of the trades plus the open volume at the price.
+        The holdings before the first deal are not counted.
+        """
+        starts = self.starts
+        buy = np.where(self.n_stock > 0, self.n_stock, 0)
+        sell = buy - self.n_stock
+        bought = grouped_cumsum(buy, starts)
+        sold = grouped_cumsum(sell, starts)
+        buy_value = grouped_cumsum(buy * self.price, starts)
+        sell_value = grouped_cumsum(sell * self.price, starts)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            average_buy = np.where(bought > 0, buy_value / bought, 0)
+            average_sell = np.where(sold > 0, sell_value / sold, 0)
+
+        matched = np.minimum(bought, sold)
+        realized = matched * (average_sell - average_buy)
+        open_n_stock = bought - sold
+        average_open = np.where(open_n_stock > 0, average_buy, average_sell)
+        unrealized = open_n_stock * (self.price - average_open)
+        return realized, unrealized
+
+    def player_summary(self):
+        """Columns of the totals of each player, at the end of the log"""
+        n_player = len(self.player_ids)
+        player = self.player
+        last = self.ends - 1
+
+        realized, unrealized = self.pnl_paths()
+        # Mark the open volume at the last price of the log instead
+        open_n_stock = np.bincount(player, weights=self.n_stock, minlength=n_player)
+        unrealized_last = unrealized[last] + open_n_stock * (self.last_price - self.price[last])
+
+        initial_position = self.position[self.starts] - self.n_stock[self.starts]
+        return {
+            "player_id": np.array(self.player_ids),
+            "strategy": np.array(self.strategies),
+            "n_trade": np.bincount(player, minlength=n_player),
+            "bought": np.bincount(player, weights=np.maximum(self.n_stock, 0), minlength=n_player),
+            "sold": np.bincount(player, weights=np.maximum(-self.n_stock, 0), minlength=n_player),
+            "turnover": np.bincount(player, weights=np.abs(self.cash), minlength=n_player),
+            "initial_position": initial_position,
+            "position": self.position[last],
+            "money": self.money[last],
+            "realized": realized[last],
+            "unrealized": unrealized_last,
+            "pnl": realized[last] + unrealized_last,
+        }
+
+    def strategy_summary(self):
+        """The player totals summed by strategy. strategy -> {column: total}"""
+        summary = self.player_summary()
+        names, strategy = np.unique(summary["strategy"], return_inverse=True)
+        totals = {}
+        for column in ("n_trade", "bought", "sold", "turnover", "position", "realized", "unrealized", "pnl"):
+            totals[column] = np.bincount(strategy, weights=summary[column], minlength=len(names))
+        n_player = np.bincount(strategy, minlength=len(names))
+        return {
+            name: dict(n_player=int(n_player[i]), **{column: float(total[i]) for column, total in totals.items()})
+            for i, name in enumerate(names)
+        }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file_name", nargs="?", default="deal.log")
+    args = parser.parse_args()
+
+    history = DealHistory(args.file_name)
+    print(f"deals={history.n_deal} players={len(history.player_ids)} last_price={history.last_price}")
+    for name, totals in history.strategy_summary().items():
+        print(name, "\t".join(f"{column}={value:,.2f}" for column, value in totals.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+from offer import DEFAULT_SYMBOL
+from array import array
+import csv
+
+class BarStore:
+    """
+    Done bars of one symbol and resolution, a typed array per field.
+    A column can be used without a copy, e.g. numpy.frombuffer(store.columns["close"]).
+    """
+    FIELDS = ("tick", "open", "high", "low", "close", "volume", "vwap")
+    TYPES = ("q", "d", "d", "d", "d", "q", "d")
+
+    def __init__(self, resolution):
+        # tick is the first tick of a bar
+        self.resolution = resolution
+        self.columns = {field: array(type_code) for field, type_code in zip(self.FIELDS, self.TYPES)}
+
+    def append(self, bar):
+        for column, value in zip(self.columns.values(), bar):
+            column.append(value)
+
+    def __len__(self):
+        return len(self.columns["tick"])
+
+    def __getitem__(self, i):
+        return tuple(column[i] for column in self.columns.values())
+
+    def write_csv(self, file):
+        writer = csv.writer(file)
+        writer.writerow(self.FIELDS)
+        writer.writerows(zip(*self.columns.values()))
+
+class BarBuilder:
+    """
+    OHLCV and VWAP bars of the fills, at several resolutions (in ticks) at once.
+    Subscribe it to an ex by attach(). Each fill updates the open bar of
+    each resolution. A bar is done when a fill of a later bar comes, or on flush().
+    Ticks without fills have no bar.
+    """
+    def __init__(self, resolutions=(1, 10, 100, 1000)):
+        self.resolutions = resolutions
+
+        # symbol -> the open bar of each resolution:
+        # [bar index, open, high, low, close, volume, price * volume]
+        self.open_bars = {}
+        # (symbol, resolution) -> BarStore
+        self.stores = {}
+
+    def attach(self, ex):
+        ex.subscribe_fills(self.on_fill)
+
+    def on_fill(self, tick, symbol, n_stock, price):
+        open_bars = self.open_bars.get(symbol)
+        if open_bars is None:
+            open_bars = self.open_bars[symbol] = [None] * len(self.resolutions)
+
+        for i, resolution in enumerate(self.resolutions):
+            index = tick // resolution
+            bar = open_bars[i]
+            if bar is None or bar[0] != index:
+                if bar is not None:
+                    self.done(symbol, resolution, bar)
+                open_bars[i] = [index, price, price, price, price, n_stock, price * n_stock]
+                continue
+
+            if price > bar[2]:
+                bar[2] = price
+            elif price < bar[3]:
+                bar[3] = price
+            bar[4] = price
+            bar[5] += n_stock
+            bar[6] += price * n_stock
+
+    def done(self, symbol, resolution, bar):
+        index, open_price, high, low, close, volume, value = bar
+        store = self.bars(resolution, symbol)
+        store.append((index * resolution, open_price, high, low, close, volume, value / volume))
+
+    def flush(self):
+        """Finish the open bars. Call it when done."""
+        for symbol, open_bars in self.open_bars.items():
+            for resolution, bar in zip(self.resolutions, open_bars):
+                if bar is not None:
+                    self.done(symbol, resolution, bar)
+        self.open_bars.clear()
+
+    def bars(self, resolution, symbol=DEFAULT_SYMBOL):
+        key = (symbol, resolution)
+        if key not in self.stores:
+            self.stores[key] = BarStore(resolution)
+        return self.stores[key]
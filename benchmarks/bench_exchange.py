@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the matching engine and the tick loop.
+
+    python benchmarks/bench_exchange.py             # all, save bench_<commit>.json
+    python benchmarks/bench_exchange.py --quick     # smaller sizes
+    python benchmarks/bench_exchange.py --compare old.json new.json
+
+Every scenario has a fixed seed, so results of different commits are comparable.
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from offer import Direction, Offer
+from player import Puppet, RandomWalker, ValueInvestor
+from exchange import Ex
+from deallog import NullDealLog
+from collections import deque
+from datetime import datetime
+import argparse
+import itertools
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+class CountDealLog(NullDealLog):
+    """Count the deals. Write nothing."""
+    def __init__(self):
+        self.n_deal = 0
+
+    def write(self, tick, buyer, seller, n_stock, price):
+        self.n_deal += 1
+        return 0
+
+def new_ex(continuous=False):
+    ex = Ex(deal_log=CountDealLog(), link_log=False, continuous=continuous)
+
+    # Count the offers (new and cancel) given to the ex
+    ex.n_offer = 0
+    add_offers = ex.add_offers
+    def count_add_offers(offers):
+        ex.n_offer += len(offers)
+        add_offers(offers)
+    ex.add_offers = count_add_offers
+
+    return ex
+
+def tick_random_walkers(n_player, n_tick):
+    """The population of run.py, with n_player RandomWalkers"""
+    ex = new_ex()
+    for i in range(n_player):
+        ex.add_player(RandomWalker(f"rand_{i}", 0, 0))
+    ex.add_player(ValueInvestor("val_1", 1_000_000_000, 2_000))
+
+    start = time.perf_counter()
+    for _ in range(n_tick):
+        ex.tick()
+        ex.deal()
+    return ex, n_tick, time.perf_counter() - start
+
+def tick_puppets(n_player, n_tick, continuous=False):
+    """Puppets with random offers decided before the clock starts"""
+    ex = new_ex(continuous)
+    for i in range(n_player):
+        p = Puppet(f"player_{i}", 1_000_000_000, 1_000_000)
+        p.assign_decisions(deque(
+            Offer(p.player_id,
+                  random.choice((Direction.BUY, Direction.SELL)),
+                  random.randint(1, 40),
+                  round(random.gauss(100, 2), 1))
+            for _ in range(n_tick)
+        ))
+        ex.add_player(p)
+
+    start = time.perf_counter()
+    for _ in range(n_tick):
+        ex.tick()
+        ex.deal()
+    return ex, n_tick, time.perf_counter() - start
+
+def book_depth(n_level, cancel_ratio, n_flow):
+    """
+    n_level price levels on each side, not crossing, tick apart.
+    The tick is 0.01, or smaller for a deep book, so the bids stay above 50.
+    Then n_flow offers come: a cancel of a resting offer by cancel_ratio,
+    else a new offer. One in ten new offers crosses the spread.
+    """
+    ex = new_ex()
+    p = Puppet("maker", 1_000_000_000, 1_000_000_000)
+    p.assign_decisions(deque())
+    ex.add_player(p)
+
+    tick = min(0.01, 50 / n_level)
+    resting = []
+    for i in range(n_level):
+        for direction, price in ((Direction.BUY, 100 - tick * (i + 1)), (Direction.SELL, 100 + tick * (i + 1))):
+            offer = Offer("maker", direction, 10, round(price, 4))
+            p.outstanding_offer.add(offer)
+            resting.append(offer)
+    ex.add_offers(resting)
+
+    flow = []
+    for _ in range(n_flow):
+        if resting and random.random() < cancel_ratio:
+            i = random.randrange(len(resting))
+            resting[i], resting[-1] = resting[-1], resting[i]
+            flow.append(resting.pop())
+            continue
+
+        direction = random.choice((Direction.BUY, Direction.SELL))
+        if random.random() < 0.1:
+            # Cross the spread
+            price = 100 + tick * direction.value * random.randint(1, 5)
+        else:
+            price = 100 - tick * direction.value * random.randint(1, n_level)
+        offer = Offer("maker", direction, 10, round(price, 4))
+        p.outstanding_offer.add(offer)
+        resting.append(offer)
+        flow.append(offer)
+
+    # Prices a real run could have
+    lowest_bid = min(offer.price for offer in itertools.chain(resting, flow) if offer.direction == Direction.BUY)
+    assert lowest_bid > 0, f"Bid at {lowest_bid}"
+
+    # Count the flow only
+    ex.n_offer = 0
+
+    # A batch of 100 offers is a tick
+    start = time.perf_counter()
+    for i in range(0, n_flow, 100):
+        offers = [offer for offer in flow[i:i + 100] if offer.offer_id in ex.offers or offer.n_stock > 0]
+        ex.add_offers(offers)
+        ex.deal()
+    for _ in range(n_flow):
+        ex.best_offers(Direction.BUY)
+        ex.best_offers(Direction.SELL)
+    return ex, n_flow // 100, time.perf_counter() - start
+
+def measure(name, params, scenario):
+    # Time without tracemalloc. It slows everything down.
+    random.seed(1)
+    ex, n_tick, seconds = scenario(**params)
+    result = {
+        "name": name,
+        "params": params,
+        "seconds": seconds,
+        "ticks_per_sec": n_tick / seconds,
+        "offers_per_sec": ex.n_offer / seconds,
+        "fills_per_sec": ex.deal_log.n_deal / seconds,
+        "n_offer": ex.n_offer,
+        "n_fill": ex.deal_log.n_deal,
+    }
+    del ex
+
+    random.seed(1)
+    tracemalloc.start()
+    ex, _, _ = scenario(**params)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del ex
+    result["peak_memory_bytes"] = peak
+
+    return result
+
+def scenarios(quick):
+    if quick:
+        n_tick = 200
+        depths = (10, 100, 1_000)
+        n_flow = 2_000
+    else:
+        n_tick = 2_000
+        depths = (10, 100, 1_000, 10_000, 100_000)
+        n_flow = 20_000
+
+    yield "tick_random_walkers", {"n_player": 20, "n_tick": n_tick}, tick_random_walkers
+    yield "tick_random_walkers", {"n_player": 200, "n_tick": n_tick}, tick_random_walkers
+    yield "tick_puppets", {"n_player": 10, "n_tick": n_tick}, tick_puppets
+    yield "tick_puppets", {"n_player": 10, "n_tick": n_tick, "continuous": True}, tick_puppets
+
+    for n_level in depths:
+        for cancel_ratio in (0, 0.5, 0.95):
+            yield "book_depth", {"n_level": n_level, "cancel_ratio": cancel_ratio, "n_flow": n_flow}, book_depth
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run(quick=False):
+    results = []
+    for name, params, scenario in scenarios(quick):
+        result = measure(name, params, scenario)
+        print(f"{name:20} {json.dumps(params):60} "
+              f"ticks/s={result['ticks_per_sec']:10.1f} "
+              f"offers/s={result['offers_per_sec']:10.0f} "
+              f"fills/s={result['fills_per_sec']:10.0f} "
+              f"peak={result['peak_memory_bytes'] / 2**20:8.1f}MiB")
+        results.append(result)
+
+    return {
+        "commit": git_commit(),
+        "time": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "quick": quick,
+        "results": results,
+    }
+
+def compare(old_file_name, new_file_name):
+    with open(old_file_name) as f:
+        old = json.load(f)
+    with open(new_file_name) as f:
+        new = json.load(f)
+
+    print(f"{old['commit']} -> {new['commit']}")
+    old_results = {(r["name"], json.dumps(r["params"])): r for r in old["results"]}
+    for r in new["results"]:
+        key = (r["name"], json.dumps(r["params"]))
+        if key not in old_results:
+            continue
+        ratio = old_results[key]["seconds"] / r["seconds"]
+        print(f"{r['name']:20} {key[1]:60} speedup={ratio:6.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--output", default=None, help="default: bench_<commit>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args.quick)
+    output = args.output or f"bench_{report['commit']}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+from offer import Direction
+from collections import OrderedDict
+import bisect
+import heapq
+import itertools
+
+class Level(OrderedDict):
+    """
+    A price level: offer_id -> offer, in time priority.
+    n_stock is the total of its offers, kept by the book on add, fill and remove.
+    len() is the number of offers.
+    """
+    def __init__(self):
+        super().__init__()
+        self.n_stock = 0
+
+    def clear(self):
+        super().clear()
+        self.n_stock = 0
+
+class Depth:
+    """Top of the book and L2 depth, for the books with best() and levels()"""
+    def best_bid(self):
+        price, offers = self.best(Direction.BUY)
+        return None if offers is None else price
+
+    def best_ask(self):
+        price, offers = self.best(Direction.SELL)
+        return None if offers is None else price
+
+    def spread(self):
+        bid = self.best_bid()
+        ask = self.best_ask()
+        if bid is None or ask is None:
+            return None
+        return round(ask - bid, 9)
+
+    def depth(self, direction, k=None):
+        """(price, n_stock, n_offers) of the best k levels. All levels if k is None."""
+        return [
+            (price, offers.n_stock, len(offers))
+            for price, offers in itertools.islice(self.levels(direction), k)
+        ]
+
+class Book(Depth):
+    """
+    The offers waiting on the exchange, both sides.
+    price2offer[direction][price] is a price level:
+    a Level of offer_id -> offer, in time priority.
+    """
+    def __init__(self):
+        self.price2offer = {}
+        self.price2offer[Direction.BUY] = {}
+        self.price2offer[Direction.SELL] = {}
+
+        # Sorted price levels of each side, best price at the end.
+        # The key is price * direction.value, so that
+        # the highest buy and the lowest sell both sort to the end.
+        self.price_index = {}
+        self.price_index[Direction.BUY] = []
+        self.price_index[Direction.SELL] = []
+
+    def add(self, offer):
+        price2offer = self.price2offer[offer.direction]
+        if offer.price not in price2offer:
+            # offer_id -> offer, in time priority
+            price2offer[offer.price] = Level()
+            bisect.insort(self.price_index[offer.direction], offer.price * offer.direction.value)
+        offers = price2offer[offer.price]
+        offers[offer.offer_id] = offer
+        offers.n_stock += offer.n_stock
+
+    def remove(self, offer):
+        """
+        Unlink the offer from its price level.
+        A level is an OrderedDict (a doubly linked list inside),
+        so it is O(1) no matter where the offer is in the queue.
+        Empty level is removed right away.
+        """
+        offers = self.price2offer[offer.direction][offer.price]
+        del offers[offer.offer_id]
+        offers.n_stock -= offer.n_stock
+        if not offers:
+            self.del_price_level(offer.direction, offer.price)
+
+    def filled(self, offer, n_stock):
+        """n_stock of the offer is dealt. The offer stays until removed."""
+        self.price2offer[offer.direction][offer.price].n_stock -= n_stock
+
+    def levels_beyond(self, direction, price):
+        """(price, offers) of the levels worse than price, from the worst"""
+        price2offer = self.price2offer[direction]
+        price_index = self.price_index[direction]
+        # The worst levels are at the start of the index
+        i = bisect.bisect_left(price_index, price * direction.value)
+        return [(key * direction.value, price2offer[key * direction.value]) for key in price_index[:i]]
+
+    def del_price_level(self, direction, price):
+        del self.price2offer[direction][price]
+
+        price_index = self.price_index[direction]
+        key = price * direction.value
+        if price_index[-1] == key:
+            # Usually it is the best price. No search needed.
+            price_index.pop()
+        else:
+            del price_index[bisect.bisect_left(price_index, key)]
+
+    def best(self, direction):
+        """
+        return best price and its offers
+        If offers is None, no offer on this side.
+        """
+        price_index = self.price_index[direction]
+
+        if not price_index:
+            # Empty levels are removed right away.
+            # No index means no offer on this side.
+            return -2, None # -2 is not useful now. Just leave some trail.
+
+        best_price = price_index[-1] * direction.value
+        return best_price, self.price2offer[direction][best_price]
+
+    def levels(self, direction):
+        """Yield (price, offers) from the best price to the worst"""
+        price2offer = self.price2offer[direction]
+        for key in reversed(self.price_index[direction]):
+            price = key * direction.value
+            yield price, price2offer[price]
+
+    def n_levels(self):
+        return len(self.price_index[Direction.BUY]) + len(self.price_index[Direction.SELL])
+
+    def clear(self):
+        for direction in (Direction.BUY, Direction.SELL):
+            self.price2offer[direction].clear()
+            self.price_index[direction].clear()
+
+class GridBook(Depth):
+    """
+    A book on a fixed tick grid from low to high.
+    Each grid price has a preallocated level, found by index instead of hashing a float.
+    An occupancy map (one byte per level) lets the best price and the next level
+    be found by scanning the map.
+    Prices outside the grid (or not on a tick) go to a normal Book.
+    """
+    def __init__(self, low, high, tick_size=0.1):
+        self.low = low
+        self.tick_size = tick_size
+        self.size = int(round((high - low) / tick_size)) + 1
+
+        self.prices = [round(low + i * tick_size, 9) for i in range(self.size)]
+
+        self.grid = {}
+        self.occupied = {}
+        self.best_index = {}
+        for direction in (Direction.BUY, Direction.SELL):
+            self.grid[direction] = [Level() for _ in range(self.size)]
+            self.occupied[direction] = bytearray(self.size)
+        # Index of the best level. -1 for BUY and size for SELL means empty.
+        self.best_index[Direction.BUY] = -1
+        self.best_index[Direction.SELL] = self.size
+
+        self.outside = Book()
+
+    def index(self, price):
+        """Grid index of the price. -1 if the price is not on the grid."""
+        i = round((price - self.low) / self.tick_size)
+        if 0 <= i < self.size and abs(self.prices[i] - price) < 1e-9:
+            return i
+        return -1
+
+    def add(self, offer):
+        direction = offer.direction
+        i = self.index(offer.price)
+        if i < 0:
+            self.outside.add(offer)
+            return
+
+        offers = self.grid[direction][i]
+        offers[offer.offer_id] = offer
+        offers.n_stock += offer.n_stock
+        self.occupied[direction][i] = 1
+
+        if direction == Direction.BUY:
+            if i > self.best_index[direction]:
+                self.best_index[direction] = i
+        else:
+            if i < self.best_index[direction]:
+                self.best_index[direction] = i
+
+    def remove(self, offer):
+        direction = offer.direction
+        i = self.index(offer.price)
+        if i < 0:
+            self.outside.remove(offer)
+            return
+
+        offers = self.grid[direction][i]
+        del offers[offer.offer_id]
+        offers.n_stock -= offer.n_stock
+        if offers:
+            return
+
+        occupied = self.occupied[direction]
+        occupied[i] = 0
+        if i != self.best_index[direction]:
+            return
+
+        # The best level is gone. Scan for the next one.
+        if direction == Direction.BUY:
+            self.best_index[direction] = occupied.rfind(1, 0, i)
+        else:
+            j = occupied.find(1, i + 1)
+            self.best_index[direction] = j if j >= 0 else self.size
+
+    def filled(self, offer, n_stock):
+        i = self.index(offer.price)
+        if i < 0:
+            self.outside.filled(offer, n_stock)
+            return
+        self.grid[offer.direction][i].n_stock -= n_stock
+
+    def levels_beyond(self, direction, price):
+        """(price, offers) of the levels worse than price, the grid ones from the worst"""
+        levels = self.outside.levels_beyond(direction, price)
+
+        grid = self.grid[direction]
+        occupied = self.occupied[direction]
+        prices = self.prices
+        if direction == Direction.BUY:
+            i = occupied.find(1)
+            while i >= 0 and prices[i] < price:
+                levels.append((prices[i], grid[i]))
+                i = occupied.find(1, i + 1)
+        else:
+            i = occupied.rfind(1)
+            while i >= 0 and prices[i] > price:
+                levels.append((prices[i], grid[i]))
+                i = occupied.rfind(1, 0, i)
+        return levels
+
+    def grid_best(self, direction):
+        i = self.best_index[direction]
+        if 0 <= i < self.size:
+            return self.prices[i], self.grid[direction][i]
+        return -2, None
+
+    def best(self, direction):
+        grid_price, grid_offers = self.grid_best(direction)
+        outside_price, outside_offers = self.outside.best(direction)
+
+        if outside_offers is None:
+            return grid_price, grid_offers
+        if grid_offers is None:
+            return outside_price, outside_offers
+
+        if outside_price * direction.value > grid_price * direction.value:
+            return outside_price, outside_offers
+        return grid_price, grid_offers
+
+    def grid_levels(self, direction):
+        grid = self.grid[direction]
+        occupied = self.occupied[direction]
+        i = self.best_index[direction]
+        if direction == Direction.BUY:
+            while i >= 0:
+                yield self.prices[i], grid[i]
+                i = occupied.rfind(1, 0, i)
+        else:
+            while 0 <= i < self.size:
+                yield self.prices[i], grid[i]
+                i = occupied.find(1, i + 1)
+
+    def levels(self, direction):
+        """Yield (price, offers) from the best price to the worst"""
+        return heapq.merge(
+            self.grid_levels(direction),
+            self.outside.levels(direction),
+            key=lambda level: -level[0] * direction.value,
+        )
+
+    def n_levels(self):
+        n = self.outside.n_levels()
+        for direction in (Direction.BUY, Direction.SELL):
+            n += self.occupied[direction].count(1)
+        return n
+
+    def clear(self):
+        for direction in (Direction.BUY, Direction.SELL):
+            for _, offers in list(self.grid_levels(direction)):
+                offers.clear()
+            self.occupied[direction][:] = bytes(self.size)
+        self.best_index[Direction.BUY] = -1
+        self.best_index[Direction.SELL] = self.size
+        self.outside.clear()
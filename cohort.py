@@ -0,0 +1,157 @@
+from offer import Direction, DEFAULT_SYMBOL
+from deallog import format_player
+import numpy as np
+
+class RandomWalkerCohort:
+    """
+    Many RandomWalkers as one player of the ex.
+    The state of the members are arrays, and decide() draws
+    the directions, prices and sizes of all members in one go.
+
+    The offers of the cohort have player_id of the cohort.
+    The ex finds the member of an offer by account(offer).
+    """
+    # For the totals of each strategy in the ex
+    strategy = "RandomWalker"
+
+    def __init__(self, player_id, size, money, n_stock, seed=None):
+        self.player_id = player_id
+        self.size = size
+        self.n_handles = size
+
+        self.member_ids = np.arange(size)
+        # In cents, so the sum is exact
+        self.money_cents = np.full(size, round(money * 100), dtype=np.int64)
+        self.n_stocks = np.full(size, n_stock, dtype=np.int64)
+        self.price_direction = np.full(size, 0.5)
+
+        # Offer ID of the outstanding offer of each member. -1 if none.
+        self.outstanding = np.full(size, -1, dtype=np.int64)
+        # The offers made in the last decide. Member i made offers[i].
+        self.offers = []
+        self.first_offer_id = 0
+
+        self.rng = np.random.default_rng(seed)
+
+        self.handle = None
+        self.ex = None
+
+    def assign_ex(self, ex):
+        self.ex = ex
+
+    @property
+    def money(self):
+        return int(self.money_cents.sum()) / 100
+
+    @property
+    def n_stock(self):
+        return int(self.n_stocks.sum())
+
+    @property
+    def positions(self):
+        # A cohort only trades the default symbol
+        return {DEFAULT_SYMBOL: self.n_stock}
+
+    def __repr__(self):
+        return f"ID:{self.player_id}\t${self.money:,.2f}\tN:{self.n_stock}\tsize:{self.size}"
+
+    def schedule(self, scheduler):
+        scheduler.every(self, 1)
+
+    def member_of(self, offer):
+        # The offers of a decide have consecutive IDs, member by member.
+        return offer.offer_id - self.first_offer_id
+
+    def account(self, offer):
+        return CohortMember(self, self.member_of(offer))
+
+    def clear_offers(self):
+        self.outstanding[:] = -1
+
+    def offer_expired(self, offer):
+        # Offers of an older decide are cancelled already
+        member = self.member_of(offer)
+        if 0 <= member < self.size and self.outstanding[member] == offer.offer_id:
+            self.outstanding[member] = -1
+
+    def decide(self):
+        """Same as RandomWalker.decide, for all members at once"""
+        final_price = self.ex.final_price
+
+        if final_price > 125:
+            self.price_direction[:] = -0.5
+        elif final_price < 75:
+            self.price_direction[:] = 0.5
+
+        rng = self.rng
+        sides = rng.choice((Direction.BUY.value, Direction.SELL.value), self.size)
+        prices = np.round(rng.normal(final_price + self.price_direction, 2), 1)
+        # int() of RandomWalker truncates toward 0
+        n_stocks = np.trunc(rng.normal(20, 6, self.size)).astype(np.int64)
+
+        # Cancel all old offers. Before the new offers,
+        # so every fill after this is on the new offers.
+        my_offers = [self.offers[i] for i in np.flatnonzero(self.outstanding >= 0)]
+
+        self.offers = self.ex.new_offers(self.player_id, sides.tolist(), n_stocks.tolist(), prices.tolist())
+        self.first_offer_id = self.offers[0].offer_id if self.offers else 0
+        self.outstanding[:] = self.member_ids + self.first_offer_id
+
+        my_offers.extend(self.offers)
+        return my_offers
+
+    def deal_done(self, offer, direction, n_stock, price):
+        return self.account(offer).deal_done(offer, direction, n_stock, price)
+
+class CohortMember:
+    """One member of a cohort, seen as a player"""
+    __slots__ = ("cohort", "member")
+
+    def __init__(self, cohort, member):
+        self.cohort = cohort
+        self.member = member
+
+    @property
+    def player_id(self):
+        return f"{self.cohort.player_id}_{self.member}"
+
+    @property
+    def handle(self):
+        return self.cohort.handle + self.member
+
+    @property
+    def money(self):
+        return int(self.cohort.money_cents[self.member]) / 100
+
+    @property
+    def n_stock(self):
+        return int(self.cohort.n_stocks[self.member])
+
+    def __repr__(self):
+        return format_player(self.player_id, self.money, self.n_stock)
+
+    def deal_done(self, offer, direction, n_stock, price):
+        """Same as Player.deal_done"""
+        cohort = self.cohort
+        member = self.member
+
+        if cohort.outstanding[member] != offer.offer_id:
+            return False
+
+        offer.n_stock -= n_stock
+
+        money_cents = round(round(n_stock * price, 2) * 100)
+        if direction == Direction.BUY:
+            cohort.n_stocks[member] += n_stock
+            cohort.money_cents[member] -= money_cents
+            cohort.ex.update_totals(cohort, -money_cents, n_stock)
+
+        if direction == Direction.SELL:
+            cohort.n_stocks[member] -= n_stock
+            cohort.money_cents[member] += money_cents
+            cohort.ex.update_totals(cohort, money_cents, -n_stock)
+
+        if offer.n_stock == 0:
+            cohort.outstanding[member] = -1
+
+        return True
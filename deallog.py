@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+
+from offer import DEFAULT_SYMBOL
+from datetime import datetime
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import uuid
+
+def new_log_name():
+    now = datetime.now().strftime("%Y%m%d_%H%M%S")
+    run_id = uuid.uuid4()
+    return f'deal_{now}_{run_id}.log'
+
+def format_player(player_id, money, n_stock):
+    """Same as Player.__repr__"""
+    return f"ID:{player_id}\t${money:,.2f}\tN:{n_stock}"
+
+class TextDealLog:
+    """
+    One line per deal:
+    buyer, seller (as Player.__repr__), n_stock, price. Tab separated.
+    """
+    def __init__(self, file_name=None):
+        if file_name is None:
+            file_name = new_log_name()
+        self.file_name = file_name
+        self.output_file = open(file_name, 'w')
+
+    def write(self, tick, buyer, seller, n_stock, price):
+        return self.output_file.write(f"{buyer}\t{seller}\t{n_stock}\t{price}\n")
+
+    def flush(self):
+        self.output_file.flush()
+
+    def close(self):
+        self.output_file.close()
+
+class NullDealLog:
+    """Write nothing. For runs that only need the stat."""
+    file_name = None
+
+    def write(self, tick, buyer, seller, n_stock, price):
+        return 0
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+# Header of a binary deal log
+MAGIC = b"SMDEAL01"
+
+# tick, buyer handle, seller handle, n_stock, price,
+# buyer money, buyer n_stock, seller money, seller n_stock (after the deal)
+RECORD = struct.Struct("<qIIqddqdq")
+
+class BinaryDealLog:
+    """
+    Fixed-width deal records after an 8 bytes header.
+    Records are packed into a preallocated buffer,
+    and the buffer is written to the file only when it is full.
+
+    Players are written as their handle (see Ex.add_player).
+    The player_id of each handle is saved in the side file <file_name>.players
+    on close.
+    """
+    def __init__(self, file_name=None, buffer_records=16_384):
+        if file_name is None:
+            file_name = new_log_name()
+        self.file_name = file_name
+        self.output_file = open(file_name, 'wb')
+        self.output_file.write(MAGIC)
+
+        self.buffer = bytearray(RECORD.size * buffer_records)
+        self.offset = 0
+
+        # handle -> player_id
+        self.names = {}
+
+    def write(self, tick, buyer, seller, n_stock, price):
+        names = self.names
+        if buyer.handle not in names:
+            names[buyer.handle] = buyer.player_id
+        if seller.handle not in names:
+            names[seller.handle] = seller.player_id
+
+        RECORD.pack_into(
+            self.buffer, self.offset,
+            tick, buyer.handle, seller.handle, n_stock, price,
+            buyer.money, buyer.n_stock, seller.money, seller.n_stock,
+        )
+        self.offset += RECORD.size
+        if self.offset == len(self.buffer):
+            self.flush()
+
+        return RECORD.size
+
+    def flush(self):
+        self.output_file.write(memoryview(self.buffer)[:self.offset])
+        self.offset = 0
+
+    def close(self):
+        if self.output_file.closed:
+            return
+
+        self.flush()
+        self.output_file.close()
+
+        with open(f"{self.file_name}.players", 'w') as f:
+            for handle, player_id in self.names.items():
+                f.write(f"{handle}\t{player_id}\n")
+
+class Account:
+    """
+    The player of a deal, as it was right after the deal.
+    n_stock is the position of symbol.
+    """
+    __slots__ = ("player_id", "handle", "money", "n_stock")
+
+    def __init__(self, player, symbol=DEFAULT_SYMBOL):
+        self.player_id = player.player_id
+        self.handle = player.handle
+        self.money = player.money
+        self.n_stock = player.n_stock if symbol == DEFAULT_SYMBOL else player.positions[symbol]
+
+    def __repr__(self):
+        return format_player(self.player_id, self.money, self.n_stock)
+
+class ThreadedDealLog:
+    """
+    Write the deals of another deal log in a writer thread.
+    write() only puts the deal into a bounded queue, so the disk is off the
+    matching loop. The thread takes the deals in batches of up to batch_size.
+
+    When the queue is full, write() waits for the thread if block,
+    or drops the deal and counts it in n_dropped if not.
+
+    If the deal log raises (a full disk...), the thread keeps taking the
+    deals off the queue but writes no more, and write, flush and close
+    raise the error.
+    """
+    # Put in the queue by flush
+    FLUSH = object()
+    def __init__(self, deal_log, max_queue=65_536, block=True, batch_size=4_096):
+        self.deal_log = deal_log
+        self.file_name = deal_log.file_name
+        self.block = block
+        self.batch_size = batch_size
+
+        self.queue = queue.Queue(max_queue)
+
+        # Metrics. See metrics().
+        self.n_written = 0
+        self.n_bytes = 0
+        # The n_bytes already returned by write
+        self.n_bytes_returned = 0
+        self.n_dropped = 0
+        self.n_batch = 0
+        self.max_queue_depth = 0
+        self.write_seconds = 0.0
+        self.max_batch_seconds = 0.0
+
+        # The first error of the deal log, raised in this thread
+        self.error = None
+
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, tick, buyer, seller, n_stock, price):
+        """
+        return the bytes written by the thread since the last write, since the
+        size of this deal is not known yet. The sum is the bytes written so far.
+        """
+        if self.error is not None:
+            raise self.error
+
+        # The players change after this. Keep them as they are now.
+        deal = (tick, Account(buyer), Account(seller), n_stock, price)
+        if self.block:
+            self.queue.put(deal)
+        else:
+            try:
+                self.queue.put_nowait(deal)
+            except queue.Full:
+                self.n_dropped += 1
+                return 0
+
+        depth = self.queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+        n_bytes = self.n_bytes
+        written = n_bytes - self.n_bytes_returned
+        self.n_bytes_returned = n_bytes
+        return written
+
+    def run(self):
+        q = self.queue
+        write = self.deal_log.write
+        perf_counter = time.perf_counter
+        while True:
+            batch = [q.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(q.get_nowait())
+            except queue.Empty:
+                pass
+
+            start = perf_counter()
+            stop = False
+            n = 0
+            n_bytes = 0
+            for deal in batch:
+                if deal is None:
+                    # From close
+                    stop = True
+                elif self.error is not None:
+                    # Drain the queue, so flush and write do not wait forever
+                    pass
+                else:
+                    try:
+                        if deal is self.FLUSH:
+                            self.deal_log.flush()
+                        else:
+                            n_bytes += write(*deal)
+                            n += 1
+                    except Exception as e:
+                        self.error = e
+            elapsed = perf_counter() - start
+
+            self.n_written += n
+            self.n_bytes += n_bytes
+            self.n_batch += 1
+            self.write_seconds += elapsed
+            if elapsed > self.max_batch_seconds:
+                self.max_batch_seconds = elapsed
+
+            for _ in batch:
+                q.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        """Wait until the deals so far are written and flushed by the deal log"""
+        if self.closed:
+            return
+        self.queue.put(self.FLUSH)
+        self.queue.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        self.deal_log.close()
+        if self.error is not None:
+            raise self.error
+
+    def metrics(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "written": self.n_written,
+            "bytes": self.n_bytes,
+            "dropped": self.n_dropped,
+            "batches": self.n_batch,
+            "write_seconds": self.write_seconds,
+            "max_batch_seconds": self.max_batch_seconds,
+        }
+
+def is_binary(file_name):
+    with open(file_name, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def read_players(file_name):
+    """handle -> player_id of a binary deal log"""
+    # deal.log is a symlink. The side file is next to the real log.
+    file_name = os.path.realpath(file_name)
+
+    names = {}
+    with open(f"{file_name}.players", 'r') as f:
+        for l in f:
+            handle, player_id = l.rstrip('\n').split('\t')
+            names[int(handle)] = player_id
+    return names
+
+def read_deals(file_name, chunk_records=16_384):
+    """Yield the records of a binary deal log as tuples. See RECORD."""
+    with open(file_name, 'rb') as f:
+        assert f.read(len(MAGIC)) == MAGIC, f"{file_name} is not a binary deal log"
+
+        while chunk := f.read(RECORD.size * chunk_records):
+            yield from RECORD.iter_unpack(chunk)
+
+def to_text(file_name):
+    """Yield the lines of a binary deal log in the layout of TextDealLog"""
+    names = read_players(file_name)
+    for tick, buyer, seller, n_stock, price, buyer_money, buyer_n_stock, seller_money, seller_n_stock in read_deals(file_name):
+        yield (
+            f"{format_player(names[buyer], buyer_money, buyer_n_stock)}\t"
+            f"{format_player(names[seller], seller_money, seller_n_stock)}\t"
+            f"{n_stock}\t{price}\n"
+        )
+
+def read_lines(file_name):
+    """Lines of a deal log in text layout, no matter it is binary or text"""
+    if is_binary(file_name):
+        yield from to_text(file_name)
+    else:
+        with open(file_name, 'r') as f:
+            yield from f
+
+def main():
+    # Convert a binary deal log to text
+    file_name = sys.argv[1] if len(sys.argv) > 1 else 'deal.log'
+    for l in read_lines(file_name):
+        sys.stdout.write(l)
+
+if __name__ == "__main__":
+    main()
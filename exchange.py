@@ -1,93 +1,391 @@
-from offer import Direction, Offer
-from collections import deque
+from offer import Direction, Offer, CompactOffer, HandleOffer, DEFAULT_SYMBOL
+from book import Book
+from deallog import TextDealLog, Account
+from stats import Stats
+from scheduler import Scheduler
+from indicators import Indicators
+import bisect
+import itertools
 import random
-import uuid
-from datetime import datetime
 import os
 
 class Ex:
-    def __init__(self):
+    def __init__(self, book=None, deal_log=None, link_log=True, instrument=False, check_invariants=False,
+                 continuous=False, auction=False, price_band=None, journal=None):
+        # See close()
+        self.closed = False
+
         self.players = {}
         self.offers = {}
 
-        self.price2offer = {}
-        self.price2offer[Direction.BUY] = {}
-        self.price2offer[Direction.SELL] = {}
+        # symbol -> book, final price and deal log of the symbol.
+        # An ex starts with DEFAULT_SYMBOL only. See add_symbol.
+        self.books = {}
+        self.final_prices = {}
+        self.deal_logs = {}
+
+        # The next offer ID given by new_offer and new_offers
+        self.next_offer_id = 0
 
         self.n_tick = 0
 
-        self.final_price = 100
+        # Running totals of all players, kept by add_player and update_totals.
+        # Money in cents, so the totals are exact. n_stock of all symbols.
+        self.total_money_cents = 0
+        self.total_n_stock = 0
+        # strategy -> [money in cents, n_stock]
+        self.strategy_totals = {}
+
+        # Check the totals are unchanged after each deal
+        self.check_invariants = check_invariants
+
+        # Match an offer when it arrives, if it crosses the best of the other side.
+        # The books are never crossed between offers, so deal() has nothing to do.
+        # Same fills as calling deal() after each offer, with the cancels
+        # of an add_offers call before its new offers.
+        self.continuous = continuous
+
+        # deal() is a call auction: all crossing offers deal at one price. See uncross.
+        self.auction = auction
+
+        # tick -> offers whose ttl is over at the start of the tick
+        self.expiry = {}
+        # Drop offers more than price_band away from the final price, each tick.
+        # None to keep them.
+        self.price_band = price_band
+
+        # Who decides in a tick. Players tell it when they want to wake up.
+        self.scheduler = Scheduler()
 
-        now = datetime.now().strftime("%Y%m%d_%H%M%S")
-        run_id = uuid.uuid4()
-        self.output_file_name = f'deal_{now}_{run_id}.log'
-        self.output_file = open(self.output_file_name, 'w')
+        # Moving averages etc. of the final price, for all players
+        self.indicators = Indicators()
+
+        # Called as listener(tick, symbol, n_stock, price) for each fill
+        self.fill_listeners = []
+
+        # The next integer handle of players, for the binary deal log.
+        self.next_handle = 0
+
+        # Records the offers of add_offers, the deals and the fills. See journal.py.
+        # None to record nothing.
+        self.journal = None
+        if journal is not None:
+            journal.attach(self)
+
+        # Timers and counters of each phase. See instrument().
+        self.stats = None
+
+        # Book by default. Or a GridBook for a bounded price band.
+        # TextDealLog by default. Or a BinaryDealLog.
+        if deal_log is None:
+            deal_log = TextDealLog()
+        self.add_symbol(DEFAULT_SYMBOL, book, deal_log)
+        # Point deal.log to the deal log when done.
+        # Turn it off when many Ex run at the same time.
+        self.link_log = link_log
+
+        if instrument:
+            self.instrument()
 
     def __del__(self):
-        self.output_file.close()
+        self.close()
+
+    def close(self):
+        """
+        Close the deal logs, and point deal.log to the deal log.
+        Call it when done. __del__ may run too late, at the exit,
+        when the files are finalized already.
+        """
+        if self.closed:
+            return
+        self.closed = True
+
+        # A ThreadedDealLog raises the error of its thread on close.
+        # Close all the others anyway, then raise the first error.
+        error = None
+        for deal_log in self.deal_logs.values():
+            try:
+                deal_log.close()
+            except Exception as e:
+                if error is None:
+                    error = e
+        try:
+            if self.journal is not None:
+                self.journal.close()
+        finally:
+            if error is not None:
+                raise error
+
+        if not self.link_log or self.deal_log.file_name is None:
+            # NullDealLog has no file
+            return
 
         try:
             os.remove('deal.log')
         except FileNotFoundError:
             pass
 
-        os.symlink(self.output_file_name, 'deal.log')
+        os.symlink(self.deal_log.file_name, 'deal.log')
+
+    def add_symbol(self, symbol, book=None, deal_log=None, price=100):
+        """
+        Trade symbol on this ex, with its own book, final price and deal log.
+        Offers of a symbol only deal with offers of the same symbol.
+        """
+        if book is None:
+            book = Book()
+        if deal_log is None:
+            deal_log = TextDealLog()
+        self.books[symbol] = book
+        self.final_prices[symbol] = price
+        self.deal_logs[symbol] = deal_log
+        if self.stats is not None:
+            self.stats.attach_deal_log(deal_log)
+
+    # The book, final price and deal log of DEFAULT_SYMBOL.
+    # A single symbol ex only uses these.
+    @property
+    def book(self):
+        return self.books[DEFAULT_SYMBOL]
+
+    @property
+    def final_price(self):
+        return self.final_prices[DEFAULT_SYMBOL]
+
+    @final_price.setter
+    def final_price(self, price):
+        self.final_prices[DEFAULT_SYMBOL] = price
+
+    @property
+    def deal_log(self):
+        return self.deal_logs[DEFAULT_SYMBOL]
+
+    def instrument(self):
+        """
+        Start to collect the time and counters of each phase.
+        Without it, nothing is timed and nothing is counted.
+        """
+        if self.stats is None:
+            self.stats = Stats()
+            self.stats.attach(self)
+
+    def stats_snapshot(self):
+        if self.stats is None:
+            return None
+        return self.stats.snapshot()
+
+    def dump_stats(self, file=None):
+        if self.stats is not None:
+            self.stats.dump(file)
+
+    def subscribe_fills(self, listener):
+        self.fill_listeners.append(listener)
 
     def add_player(self, player):
         self.players[player.player_id] = player
+        # A cohort takes a handle for each of its members
+        player.handle = self.next_handle
+        self.next_handle += player.n_handles
         player.assign_ex(self)
+        player.schedule(self.scheduler)
+        self.update_totals(player, round(player.money * 100), player.n_stock)
+        if self.journal is not None:
+            self.journal.add_player(player)
         return True
 
+    def update_totals(self, player, money_cents, n_stock):
+        """
+        Called when the money or n_stock of a player changed.
+        money_cents and n_stock are the changes.
+        """
+        self.total_money_cents += money_cents
+        self.total_n_stock += n_stock
+
+        totals = self.strategy_totals.setdefault(player.strategy, [0, 0])
+        totals[0] += money_cents
+        totals[1] += n_stock
+
     def all_players_money(self):
         """
         For stat.
         If no dividends,
         the total money should be unchange.
         """
-        total = 0
-        for player_id, player in self.players.items():
-            total += player.money
-
-        return total
+        return self.total_money_cents / 100
 
     def all_players_n_stock(self):
         """
         For stat.
         the total stock should be unchange.
         """
-        total = 0
+        return self.total_n_stock
+
+    def all_strategies_totals(self):
+        """For stat. strategy -> (money, n_stock)"""
+        return {
+            strategy: (money_cents / 100, n_stock)
+            for strategy, (money_cents, n_stock) in self.strategy_totals.items()
+        }
+
+    def recount_totals(self):
+        """
+        Count the money and n_stock of all players one by one.
+        Slow. To verify the running totals.
+        """
+        money = 0
+        n_stock = 0
         for player_id, player in self.players.items():
-            total += player.n_stock
+            money += player.money
+            n_stock += sum(player.positions.values())
 
-        return total
+        return money, n_stock
 
     def tick(self):
 
         self.n_tick += 1
+        self.expire_offers()
+        if self.price_band is not None:
+            for symbol in self.books:
+                self.sweep(symbol)
+        self.indicators.update(self.final_price)
 
         #for _, player in self.players.items():
         # Access the players at random order
+        # Only the players due in this tick. The others would do nothing anyway.
 
-        players = list(self.players.values())
+        players = self.scheduler.due(self.n_tick, self.final_price)
         random.shuffle(players)
         for player in players:
             decisions = player.decide()
             if decisions:
                 self.add_offers(decisions)
 
+    def new_offer(self, player_id, direction, n_stock, price, symbol=DEFAULT_SYMBOL, ttl=None):
+        """
+        Make an offer with the next offer ID of this exchange.
+        Cheaper than Offer, which has a UUID.
+        """
+        offer_id = self.next_offer_id
+        self.next_offer_id += 1
+        return CompactOffer(player_id, direction, n_stock, price, offer_id, symbol, ttl)
+
+    def new_offers(self, player_id, sides, n_stocks, prices, symbol=DEFAULT_SYMBOL, handles=None):
+        """
+        Bulk version of new_offer, for a cohort of players.
+        sides are direction codes (1 for BUY, -1 for SELL).
+        The offer IDs are consecutive, in the order of the input.
+        With handles, the offers are HandleOffers of those agents of a ledger.
+        """
+        first_offer_id = self.next_offer_id
+        self.next_offer_id += len(sides)
+
+        directions = {Direction.BUY.value: Direction.BUY, Direction.SELL.value: Direction.SELL}
+        if handles is not None:
+            return [
+                HandleOffer(player_id, directions[side], n_stock, price, offer_id, handle, symbol)
+                for offer_id, side, n_stock, price, handle
+                in zip(itertools.count(first_offer_id), sides, n_stocks, prices, handles)
+            ]
+        return [
+            CompactOffer(player_id, directions[side], n_stock, price, offer_id, symbol)
+            for offer_id, side, n_stock, price
+            in zip(itertools.count(first_offer_id), sides, n_stocks, prices)
+        ]
+
     def add_offers(self, offers):
+        if self.continuous:
+            # decide gives a new offer and the cancels of the old ones together.
+            # The new one could fill an old one before its cancel comes,
+            # so the cancels go first, then the new offers are matched.
+            live = self.offers
+            cancels = [offer for offer in offers if offer.offer_id in live]
+            if cancels:
+                offers = [offer for offer in offers if offer.offer_id not in live]
+                self.apply_offers(cancels)
+        self.apply_offers(offers)
+
+    def apply_offers(self, offers):
+        """Add the new offers and cancel the others, in order. See add_offers."""
+        books = self.books
+        continuous = self.continuous
+        journal = self.journal
         for offer in offers:
             if offer.offer_id not in self.offers:
+                if offer.n_stock <= 0:
+                    # Dealt already. Nothing to add or cancel.
+                    continue
+                if journal is not None:
+                    journal.new(self.n_tick, offer)
                 self.offers[offer.offer_id] = offer
-                self.price2offer[offer.direction].setdefault(offer.price, deque())
-                self.price2offer[offer.direction][offer.price].append(offer.offer_id)
+                book = books[offer.symbol]
+                book.add(offer)
+                if offer.ttl is not None:
+                    self.expiry.setdefault(self.n_tick + offer.ttl, []).append(offer)
+                if continuous and crosses(book, offer):
+                    # Only the new offer could cross. A passive one just rests.
+                    while self.deal_one_price(offer.symbol):
+                        pass
             else:
                 # Same offer ID. It is a del instruction.
-                del self.offers[offer.offer_id]
+                if journal is not None:
+                    journal.cancel(self.n_tick, offer)
+                self.cancel_offer(offer.offer_id)
                 # Do not handle the player side.
                 # Since it is the player gave the del instruction,
                 # assume a player would do the book keeping right.
 
+    def cancel_offer(self, offer_id):
+        offer = self.offers.pop(offer_id)
+        self.books[offer.symbol].remove(offer)
+
+    def expire_offers(self):
+        """Drop the offers whose ttl is over. Only the bucket of this tick is looked at."""
+        for offer in self.expiry.pop(self.n_tick, ()):
+            # It may be dealt or cancelled already
+            if self.offers.get(offer.offer_id) is offer:
+                self.drop_offer(offer)
+
+    def sweep(self, symbol=DEFAULT_SYMBOL):
+        """
+        Drop the offers more than price_band away from the final price.
+        The far levels are the worst ones, so only they are looked at.
+        """
+        book = self.books[symbol]
+        final_price = self.final_prices[symbol]
+        for direction in (Direction.BUY, Direction.SELL):
+            limit = final_price - self.price_band * direction.value
+            for _, offers in book.levels_beyond(direction, limit):
+                for offer in list(offers.values()):
+                    self.drop_offer(offer)
+
+    def drop_offer(self, offer):
+        """Remove an offer for the ex, and tell its owner"""
+        del self.offers[offer.offer_id]
+        self.books[offer.symbol].remove(offer)
+        self.players[offer.player_id].offer_expired(offer)
+
+    def book_size(self):
+        """
+        For stat.
+        live: offers could be dealt.
+        dead: entries left in the price levels but not in offers.
+        It should always be 0 since a cancel unlinks the entry.
+        """
+        n_levels = 0
+        n_entries = 0
+        for book in self.books.values():
+            for direction in (Direction.BUY, Direction.SELL):
+                for _, offers in book.levels(direction):
+                    n_levels += 1
+                    n_entries += len(offers)
+
+        n_live = len(self.offers)
+        return {
+            "levels": n_levels,
+            "live": n_live,
+            "dead": n_entries - n_live,
+        }
+
     def dump(self):
         print("===== DUMP =====")
         print("offers")
@@ -95,78 +393,49 @@ class Ex:
             print(v)
 
 
-        print("price2offer[Direction.BUY]")
-        print(self.price2offer[Direction.BUY])
-        print("price2offer[Direction.SELL]")
-        print(self.price2offer[Direction.SELL])
+        for symbol, book in self.books.items():
+            print(f"{symbol} price2offer[Direction.BUY]")
+            print(dict(book.levels(Direction.BUY)))
+            print(f"{symbol} price2offer[Direction.SELL]")
+            print(dict(book.levels(Direction.SELL)))
 
         print(self.players)
-        print(f"{self.final_price=}")
-
-    def print_offers(self):
-        """Helper for debug"""
-
-        print(f"===== Tick: {self.n_tick} =====")
-
-        print("BUY")
-
-        for price, offer_ids in sorted(list(self.price2offer[Direction.BUY].items()), reverse=True):
-            print("   ", price)
-            for offer_id in offer_ids:
-                if offer_id in self.offers:
-                    print("       ",
-                          self.offers[offer_id].player_id,
-                          self.offers[offer_id].n_stock,
-                          )
-                else:
-                    print(f"        {offer_id} deleted")
-
-        print("SELL")
-        for price, offer_ids in sorted(list(self.price2offer[Direction.SELL].items())):
-            print("   ", price)
-            for offer_id in offer_ids:
-                if offer_id in self.offers:
-                    print("       ",
-                          self.offers[offer_id].player_id,
-                          self.offers[offer_id].n_stock,
-                          )
-                else:
-                    print(f"        {offer_id} deleted")
-
-    def best_offers(self, direction):
-        """
-        return best offer
-        "best" depends on the price. Buy and sell are opposite.
-        If best_offer_ids is None, no deal is on the queue
-        """
+        print(f"{self.final_prices=}")
 
-        best_price = -1
-        best_offer_ids = None
-        price2offer = self.price2offer[direction]
+    def print_offers(self, symbol=DEFAULT_SYMBOL, k=None):
+        """Helper for debug. The best k levels of each side: price, n_stock, number of offers."""
 
-        while price2offer:
-            if direction == Direction.BUY:
-                # High priced buy offer first
-                best_price = max(price2offer)
-            elif direction == Direction.SELL:
-                # Lower priced sell offer first
-                best_price = min(price2offer)
-            else:
-                # Don't support
-                pass
+        book = self.books[symbol]
 
-            if best_offer_ids := price2offer[best_price]:
-                # Found. Leave the loop.
-                break
-            else:
-                # There is a list, but it is empty. Delete it.
-                del price2offer[best_price]
-        else:
-            # the loop exit due to price2offer is False (empty)
-            best_price = -2 # not useful now. Just leave some trail.
-            best_offer_ids = None
+        print(f"===== Tick: {self.n_tick} {symbol} =====")
+
+        for direction in (Direction.BUY, Direction.SELL):
+            print(direction.name)
+            for price, n_stock, n_offers in book.depth(direction, k):
+                print("   ", price, n_stock, n_offers)
+
+    def best_bid(self, symbol=DEFAULT_SYMBOL):
+        """The highest buy price. None if no buy offer."""
+        return self.books[symbol].best_bid()
 
-        return best_price, best_offer_ids
+    def best_ask(self, symbol=DEFAULT_SYMBOL):
+        """The lowest sell price. None if no sell offer."""
+        return self.books[symbol].best_ask()
+
+    def spread(self, symbol=DEFAULT_SYMBOL):
+        return self.books[symbol].spread()
+
+    def depth(self, direction, k=None, symbol=DEFAULT_SYMBOL):
+        """(price, n_stock, n_offers) of the best k levels of a side"""
+        return self.books[symbol].depth(direction, k)
+
+    def best_offers(self, direction, symbol=DEFAULT_SYMBOL):
+        """
+        return best offer
+        "best" depends on the price. Buy and sell are opposite.
+        If best_offers is None, no deal is on the queue
+        """
+        return self.books[symbol].best(direction)
 
     def deal_one_pair(self, buy_offer, sell_offer):
         """
@@ -180,67 +449,80 @@ class Ex:
         #print(buy_offer)
         #print(sell_offer)
 
-        if buy_offer.price == sell_offer.price:
-            deal_price = buy_offer.price
-        elif buy_offer.price > sell_offer.price:
-            deal_price = round((buy_offer.price + sell_offer.price) / 2, 1)
-        else:
+        deal_price = cross_price(buy_offer.price, sell_offer.price)
+        if deal_price is None:
             # No deal
             return False
         deal_n_stock = min(buy_offer.n_stock, sell_offer.n_stock)
 
-        buyer = self.players[buy_offer.player_id]
-        seller = self.players[sell_offer.player_id]
+        return self.settle(buy_offer, sell_offer, deal_n_stock, deal_price)
+
+    def settle(self, buy_offer, sell_offer, deal_n_stock, deal_price):
+        """The players' side of a deal: money, stock, final price and the log"""
+        buy_player = self.players[buy_offer.player_id]
+        sell_player = self.players[sell_offer.player_id]
+
+        # The player, or the member of a cohort, behind the offer
+        buyer = buy_player.account(buy_offer)
+        seller = sell_player.account(sell_offer)
+
+        if self.check_invariants:
+            money_cents_before = self.total_money_cents
+            n_stock_before = self.total_n_stock
 
         buyer_ok = buyer.deal_done(buy_offer, Direction.BUY, deal_n_stock, deal_price)
         seller_ok = seller.deal_done(sell_offer, Direction.SELL, deal_n_stock, deal_price)
-        self.final_price = deal_price
+        symbol = buy_offer.symbol
+        self.final_prices[symbol] = deal_price
+
+        # The n_stock of the levels
+        book = self.books[symbol]
+        if buyer_ok:
+            book.filled(buy_offer, deal_n_stock)
+        if seller_ok:
+            book.filled(sell_offer, deal_n_stock)
+
+        self.scheduler.filled(buy_player)
+        self.scheduler.filled(sell_player)
+
+        if self.check_invariants:
+            assert self.total_money_cents == money_cents_before, \
+                f"Money leak: {buyer} {seller} {deal_n_stock} {deal_price}"
+            assert self.total_n_stock == n_stock_before, \
+                f"Stock leak: {buyer} {seller} {deal_n_stock} {deal_price}"
 
         # Record deal
-        self.output_file.write(f"{buyer}\t{seller}\t{deal_n_stock}\t{deal_price}\n")
+        if symbol == DEFAULT_SYMBOL:
+            self.deal_logs[symbol].write(self.n_tick, buyer, seller, deal_n_stock, deal_price)
+        else:
+            # n_stock of a player is the one of DEFAULT_SYMBOL. Log the position of this symbol.
+            self.deal_logs[symbol].write(self.n_tick, Account(buyer, symbol), Account(seller, symbol),
+                                         deal_n_stock, deal_price)
+
+        for listener in self.fill_listeners:
+            listener(self.n_tick, symbol, deal_n_stock, deal_price)
 
         #print(f"{buyer_ok=} {seller_ok=}")
         return buyer_ok and seller_ok
 
-    def pop_deleted_deals(self, offer_ids):
-        while offer_ids and offer_ids[0] not in self.offers:
-            offer_ids.popleft()
-
-
-    def deal_one_price(self):
+    def deal_one_price(self, symbol=DEFAULT_SYMBOL):
         """
         Find a best price and do all the deals that is suitable on this price.
         """
 
         deal_done = False
+        book = self.books[symbol]
 
-        best_buy_price, best_buy_offer_ids = (-1, None)
-        best_sell_price, best_sell_offer_ids = (-1, None)
-
-        while not (best_buy_offer_ids and best_sell_offer_ids):
-            best_buy_price, best_buy_offer_ids = self.best_offers(Direction.BUY)
+        best_buy_price, best_buy_offers = self.best_offers(Direction.BUY, symbol)
+        best_sell_price, best_sell_offers = self.best_offers(Direction.SELL, symbol)
 
-            best_sell_price, best_sell_offer_ids = self.best_offers(Direction.SELL)
-
-            if not best_buy_offer_ids or not best_sell_offer_ids:
-                # No deal
-                return False
-
-            # Pop the deleted deals.
-            # If ended up all deals of buy or sell are pop-ed,
-            # loop to find next best price
-            self.pop_deleted_deals(best_buy_offer_ids)
-            self.pop_deleted_deals(best_sell_offer_ids)
-
-        #print("best_buy_price: ", best_buy_price)
-        #print("best_buy_offer_ids: ", best_buy_offer_ids)
-
-        #print("best_sell_price: ", best_sell_price)
-        #print("best_sell_offer_ids: ", best_sell_offer_ids)
+        if not best_buy_offers or not best_sell_offers:
+            # No deal
+            return False
 
-        while best_buy_offer_ids and best_sell_offer_ids:
-            buy_offer = self.offers[best_buy_offer_ids[0]]
-            sell_offer = self.offers[best_sell_offer_ids[0]]
+        while best_buy_offers and best_sell_offers:
+            buy_offer = next(iter(best_buy_offers.values()))
+            sell_offer = next(iter(best_sell_offers.values()))
 
             deal_done_once = self.deal_one_pair(buy_offer, sell_offer)
 
@@ -253,38 +535,221 @@ class Ex:
 
             if buy_offer.n_stock == 0:
                 # remove buy_offer
-                buy_offer_id = best_buy_offer_ids.popleft()
-                del self.offers[buy_offer_id]
-                self.pop_deleted_deals(best_buy_offer_ids)
-                if not best_buy_offer_ids:
-                    del self.price2offer[Direction.BUY][best_buy_price]
+                book.remove(buy_offer)
+                del self.offers[buy_offer.offer_id]
 
 
             if sell_offer.n_stock == 0:
                 # remove sell_offer
-                sell_offer_id = best_sell_offer_ids.popleft()
-                del self.offers[sell_offer_id]
-                self.pop_deleted_deals(best_sell_offer_ids)
-                if not best_sell_offer_ids:
-                    del self.price2offer[Direction.SELL][best_sell_price]
+                book.remove(sell_offer)
+                del self.offers[sell_offer.offer_id]
 
 
         return deal_done
 
     def deal(self):
         # Keep finding best price and do deals until no more could be found.
+        # Symbol by symbol.
+        if self.journal is not None:
+            self.journal.deal(self.n_tick)
+        if self.continuous:
+            # Dealt in add_offers already
+            return False
+
+        deal_done = False
+        if self.auction:
+            for symbol in self.books:
+                if self.uncross(symbol):
+                    deal_done = True
+            return deal_done
+
+        for symbol in self.books:
+            while self.deal_one_price(symbol):
+                deal_done = True
+        return deal_done
+
+    def uncross(self, symbol=DEFAULT_SYMBOL):
+        """
+        Call auction of a symbol.
+        Find the one price that deals the most (see clearing_price),
+        then fill the offers at that price in price and time priority.
+        The final price is that price.
+        """
+        book = self.books[symbol]
+        buy_levels, sell_levels = crossing_levels(book)
+        if not buy_levels:
+            return False
+
+        deal_price, volume = clearing_price(
+            [(price, offers.n_stock) for price, offers in buy_levels],
+            [(price, offers.n_stock) for price, offers in sell_levels],
+            self.final_prices[symbol],
+        )
+
+        # Offers in priority. Copies of the levels, since filled offers leave them.
+        buy_offers = (offer for _, offers in buy_levels for offer in list(offers.values()))
+        sell_offers = (offer for _, offers in sell_levels for offer in list(offers.values()))
+        buy_offer = next(buy_offers)
+        sell_offer = next(sell_offers)
+        while volume > 0:
+            deal_n_stock = min(buy_offer.n_stock, sell_offer.n_stock, volume)
+            self.settle(buy_offer, sell_offer, deal_n_stock, deal_price)
+            volume -= deal_n_stock
+
+            if buy_offer.n_stock == 0:
+                book.remove(buy_offer)
+                del self.offers[buy_offer.offer_id]
+                buy_offer = next(buy_offers, None)
+            if sell_offer.n_stock == 0:
+                book.remove(sell_offer)
+                del self.offers[sell_offer.offer_id]
+                sell_offer = next(sell_offers, None)
+
+        return True
+
+    def deal_parallel(self, executor):
+        """
+        Same as deal, with the books matched in the worker processes of executor.
+        Symbols are independent, so the crossing levels of each book
+        (see crossing_levels) are matched on their own by match_levels.
+        Only the IDs, sizes and prices of their offers are sent.
+        The workers only return the fills. They are settled here, symbol by symbol
+        in the same order as deal, so the players and the logs end up the same.
+        Continuous and auction modes are dealt by deal.
+        """
+        if self.continuous or self.auction:
+            return self.deal()
+        if self.journal is not None:
+            self.journal.deal(self.n_tick)
+
+        futures = {}
+        for symbol, book in self.books.items():
+            buy_levels, sell_levels = crossing_levels(book)
+            if buy_levels:
+                futures[symbol] = executor.submit(match_levels, level_sizes(buy_levels), level_sizes(sell_levels))
+
         deal_done = False
-        while self.deal_one_price():
-            deal_done = True
+        for symbol, future in futures.items():
+            book = self.books[symbol]
+            for buy_offer_id, sell_offer_id, deal_n_stock, deal_price in future.result():
+                buy_offer = self.offers[buy_offer_id]
+                sell_offer = self.offers[sell_offer_id]
+                self.settle(buy_offer, sell_offer, deal_n_stock, deal_price)
+                deal_done = True
+
+                for offer in (buy_offer, sell_offer):
+                    if offer.n_stock == 0:
+                        book.remove(offer)
+                        del self.offers[offer.offer_id]
         return deal_done
 
     def del_all_offers(self):
         for player_id, player in self.players.items():
-            player.outstanding_offer.clear()
+            player.clear_offers()
 
         self.offers.clear()
-        self.price2offer[Direction.BUY].clear()
-        self.price2offer[Direction.SELL].clear()
+        self.expiry.clear()
+        for book in self.books.values():
+            book.clear()
+
+def cross_price(buy_price, sell_price):
+    """The deal price of a buy and a sell. None if they do not cross."""
+    if buy_price == sell_price:
+        return buy_price
+    if buy_price > sell_price:
+        return round((buy_price + sell_price) / 2, 1)
+    return None
+
+def clearing_price(buy_levels, sell_levels, reference_price):
+    """
+    The price of a call auction.
+    buy_levels and sell_levels are (price, n_stock) from the best price.
+    At a price p, the buys at p or higher meet the sells at p or lower.
+    return (price, volume) of the price that deals the most volume.
+    Ties go to the smaller imbalance, then to the price nearest reference_price.
+    """
+    # Cumulative depth from the best price of each side.
+    # buy_keys is -price, so that both key lists are ascending.
+    buy_keys = [-price for price, _ in buy_levels]
+    buy_depth = list(itertools.accumulate(n_stock for _, n_stock in buy_levels))
+    sell_keys = [price for price, _ in sell_levels]
+    sell_depth = list(itertools.accumulate(n_stock for _, n_stock in sell_levels))
+
+    best_key = None
+    best = (None, 0)
+    for price in set(sell_keys).union(price for price, _ in buy_levels):
+        i = bisect.bisect_right(buy_keys, -price)
+        demand = buy_depth[i - 1] if i else 0
+        i = bisect.bisect_right(sell_keys, price)
+        supply = sell_depth[i - 1] if i else 0
+
+        volume = min(demand, supply)
+        key = (volume, -abs(demand - supply), -abs(price - reference_price), -price)
+        if best_key is None or key > best_key:
+            best_key = key
+            best = (price, volume)
+    return best
+
+OPPOSITE = {Direction.BUY: Direction.SELL, Direction.SELL: Direction.BUY}
+
+def crosses(book, offer):
+    """Would the offer deal with the best of the other side"""
+    best_price, best_offers = book.best(OPPOSITE[offer.direction])
+    if best_offers is None:
+        return False
+    if offer.direction == Direction.BUY:
+        return offer.price >= best_price
+    return offer.price <= best_price
+
+def crossing_levels(book):
+    """
+    (buy levels, sell levels) that cross the best of the other side, from the best.
+    Only they could deal. Both empty if the book is not crossed.
+    """
+    best_buy_price, best_buy_offers = book.best(Direction.BUY)
+    best_sell_price, best_sell_offers = book.best(Direction.SELL)
+    if not best_buy_offers or not best_sell_offers or best_buy_price < best_sell_price:
+        return [], []
+
+    buy_levels = list(itertools.takewhile(
+        lambda level: level[0] >= best_sell_price, book.levels(Direction.BUY)))
+    sell_levels = list(itertools.takewhile(
+        lambda level: level[0] <= best_buy_price, book.levels(Direction.SELL)))
+    return buy_levels, sell_levels
+
+def level_sizes(levels):
+    """[(price, offers)] -> [(price, [(offer ID, n_stock)])]. Small to send to a worker."""
+    return [(price, [(offer.offer_id, offer.n_stock) for offer in offers.values()]) for price, offers in levels]
+
+def match_levels(buy_levels, sell_levels):
+    """
+    Match the crossing levels of a book (see level_sizes) as Ex.deal does, without the players.
+    Run in a worker process.
+    return the fills: (buy offer ID, sell offer ID, n_stock, price) in order.
+    """
+    buys = [[price, offer_id, n_stock] for price, offers in buy_levels for offer_id, n_stock in offers]
+    sells = [[price, offer_id, n_stock] for price, offers in sell_levels for offer_id, n_stock in offers]
+
+    fills = []
+    i = 0
+    j = 0
+    while i < len(buys) and j < len(sells):
+        buy = buys[i]
+        sell = sells[j]
+        deal_price = cross_price(buy[0], sell[0])
+        if deal_price is None:
+            break
+
+        deal_n_stock = min(buy[2], sell[2])
+        fills.append((buy[1], sell[1], deal_n_stock, deal_price))
+
+        buy[2] -= deal_n_stock
+        sell[2] -= deal_n_stock
+        if buy[2] == 0:
+            i += 1
+        if sell[2] == 0:
+            j += 1
+    return fills
 
 # TODO: Print or log something for analysis. Such as
 # 1. The n_stock and money of all players
@@ -292,5 +757,3 @@ class Ex:
 # Or, should it be done in a driver (who calls tick and deal) instead of inside Ex?
 
 # TODO: Lint the code
-
-# TODO (later): del out of range offers when the price moved too far away
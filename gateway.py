@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Order entry over local sockets, so a player can live in another process.
+
+    python gateway.py serve --port 7000           # or --unix /tmp/ex.sock
+    python gateway.py load --clients 10 --seconds 5 [--port 7000]
+
+Frames are a 2 bytes length, then the payload. The first byte of a payload
+is the message type. All numbers are little endian.
+
+Client to gateway:
+    L login   money (d), n_stock (q), player_id (utf-8, the rest)
+    N new     order_id (q), side (b, 1 BUY -1 SELL), n_stock (q), price (d), symbol (utf-8, the rest)
+    C cancel  order_id (q)
+    A amend   order_id (q), n_stock (q), price (d). Cancel, then new with the same order_id.
+Gateway to client:
+    F fill    tick (q), order_id (q), n_stock (q), price (d)
+    P price   tick (q), price (d), symbol (utf-8, the rest). Once per tick for a symbol whose price changed.
+    E expired tick (q), order_id (q). The ex dropped the order (see Ex.price_band).
+
+order_id is chosen by the client. Messages of a tick are added to the ex in
+one add_offers call, in the order they are received.
+
+An order with n_stock <= 0, a price that is not finite or an unknown symbol
+is ignored. A malformed frame closes the connection. A login with the
+player_id of a connected player is refused. A player who logs in again
+after a disconnect gets its player back, with the money and n_stock in the ex.
+"""
+
+from offer import Direction, DEFAULT_SYMBOL
+from player import Player
+from exchange import Ex
+from deallog import NullDealLog
+import argparse
+import asyncio
+import math
+import os
+import random
+import struct
+import time
+
+FRAME = struct.Struct("<H")
+LOGIN = struct.Struct("<dq")
+NEW = struct.Struct("<qbqd")
+CANCEL = struct.Struct("<q")
+AMEND = struct.Struct("<qqd")
+FILL = struct.Struct("<qqqd")
+PRICE = struct.Struct("<qd")
+EXPIRED = struct.Struct("<qq")
+
+DIRECTIONS = {Direction.BUY.value: Direction.BUY, Direction.SELL.value: Direction.SELL}
+
+def frame(kind, body, tail=b""):
+    payload = kind + body + tail
+    return FRAME.pack(len(payload)) + payload
+
+def encode_login(player_id, money, n_stock):
+    return frame(b"L", LOGIN.pack(money, n_stock), player_id.encode())
+
+def encode_new(order_id, direction, n_stock, price, symbol=DEFAULT_SYMBOL):
+    return frame(b"N", NEW.pack(order_id, direction.value, n_stock, price), symbol.encode())
+
+def encode_cancel(order_id):
+    return frame(b"C", CANCEL.pack(order_id))
+
+def encode_amend(order_id, n_stock, price):
+    return frame(b"A", AMEND.pack(order_id, n_stock, price))
+
+def encode_fill(tick, order_id, n_stock, price):
+    return frame(b"F", FILL.pack(tick, order_id, n_stock, price))
+
+def encode_price(tick, price, symbol):
+    return frame(b"P", PRICE.pack(tick, price), symbol.encode())
+
+def encode_expired(tick, order_id):
+    return frame(b"E", EXPIRED.pack(tick, order_id))
+
+def decode(payload):
+    """
+    return (kind, fields) of a payload. kind is one letter.
+    Raise ValueError if the payload is malformed.
+    """
+    try:
+        return decode_fields(payload)
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"Malformed message: {e}") from e
+
+def decode_fields(payload):
+    kind = chr(payload[0])
+    if kind == "L":
+        money, n_stock = LOGIN.unpack_from(payload, 1)
+        return kind, (payload[1 + LOGIN.size:].decode(), money, n_stock)
+    if kind == "N":
+        order_id, side, n_stock, price = NEW.unpack_from(payload, 1)
+        if side not in DIRECTIONS:
+            raise ValueError(f"Unknown side {side}")
+        symbol = payload[1 + NEW.size:].decode() or DEFAULT_SYMBOL
+        return kind, (order_id, DIRECTIONS[side], n_stock, price, symbol)
+    if kind == "C":
+        return kind, CANCEL.unpack_from(payload, 1)
+    if kind == "A":
+        return kind, AMEND.unpack_from(payload, 1)
+    if kind == "F":
+        return kind, FILL.unpack_from(payload, 1)
+    if kind == "E":
+        return kind, EXPIRED.unpack_from(payload, 1)
+    if kind == "P":
+        tick, price = PRICE.unpack_from(payload, 1)
+        return kind, (tick, price, payload[1 + PRICE.size:].decode())
+    raise ValueError(f"Unknown message type {kind!r}")
+
+async def read_frame(reader):
+    """return the next payload. None at the end of the stream."""
+    try:
+        header = await reader.readexactly(FRAME.size)
+        return await reader.readexactly(FRAME.unpack(header)[0])
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+class RemotePlayer(Player):
+    """
+    A player behind a connection of the gateway.
+    It never decides in Ex.tick. Its offers come from the messages of the client.
+    """
+    def __init__(self, player_id, money, n_stock, writer):
+        super().__init__(player_id, money, n_stock)
+        self.writer = writer
+        # order_id of the client <-> the offer in the ex
+        self.orders = {}
+        self.order_ids = {}
+        # Orders ignored by valid_order
+        self.n_rejected = 0
+
+    def schedule(self, scheduler):
+        pass
+
+    def decide(self):
+        return []
+
+    def valid_order(self, n_stock, price, symbol):
+        """Count and ignore an order the ex can not take"""
+        if n_stock > 0 and math.isfinite(price) and symbol in self.ex.books:
+            return True
+        self.n_rejected += 1
+        return False
+
+    def apply(self, kind, fields):
+        """return the offers (new or cancel) of a message"""
+        if kind == "N":
+            order_id, direction, n_stock, price, symbol = fields
+            if order_id in self.orders:
+                # Still live. Not a new order.
+                return []
+            if not self.valid_order(n_stock, price, symbol):
+                return []
+            return [self.new_order(order_id, direction, n_stock, price, symbol)]
+
+        if kind not in ("C", "A"):
+            # Not for the gateway
+            return []
+
+        offer = self.orders.get(fields[0])
+        if offer is None or offer not in self.outstanding_offer:
+            # Unknown or done already
+            return []
+        if kind == "A" and not self.valid_order(fields[1], fields[2], offer.symbol):
+            # The order is left as it is
+            return []
+        offers = [self.cancel_order(offer)]
+
+        if kind == "A":
+            order_id, n_stock, price = fields
+            offers.append(self.new_order(order_id, offer.direction, n_stock, price, offer.symbol))
+        return offers
+
+    def new_order(self, order_id, direction, n_stock, price, symbol):
+        offer = self.ex.new_offer(self.player_id, direction, n_stock, price, symbol)
+        self.orders[order_id] = offer
+        self.order_ids[offer.offer_id] = order_id
+        self.outstanding_offer.add(offer)
+        return offer
+
+    def cancel_order(self, offer):
+        self.outstanding_offer.remove(offer)
+        del self.orders[self.order_ids.pop(offer.offer_id)]
+        # The same offer again is a cancel. See Ex.add_offers.
+        return offer
+
+    def deal_done(self, offer, direction, n_stock, price):
+        ok = super().deal_done(offer, direction, n_stock, price)
+        if ok:
+            order_id = self.order_ids[offer.offer_id]
+            if offer.n_stock == 0:
+                del self.orders[self.order_ids.pop(offer.offer_id)]
+            if self.writer is not None and not self.writer.is_closing():
+                self.writer.write(encode_fill(self.ex.n_tick, order_id, n_stock, price))
+        return ok
+
+    def offer_expired(self, offer):
+        super().offer_expired(offer)
+        order_id = self.order_ids.pop(offer.offer_id)
+        del self.orders[order_id]
+        if self.writer is not None and not self.writer.is_closing():
+            self.writer.write(encode_expired(self.ex.n_tick, order_id))
+
+    def cancel_all(self):
+        """Cancel offers of a closed connection"""
+        return [self.cancel_order(offer) for offer in list(self.outstanding_offer)]
+
+class Gateway:
+    """
+    Serve the clients of an ex, and run its ticks.
+    Each tick: ex.tick() for the players inside, the messages received since
+    the last tick in one add_offers, ex.deal(), then push the prices.
+    """
+    def __init__(self, ex, tick_interval=0.01):
+        self.ex = ex
+        self.tick_interval = tick_interval
+
+        # (player, kind, fields) received since the last tick
+        self.pending = []
+        self.writers = set()
+
+        self.n_message = 0
+        self.servers = []
+
+    async def serve_tcp(self, host="127.0.0.1", port=7000):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        self.servers.append(server)
+        return server
+
+    async def serve_unix(self, path):
+        server = await asyncio.start_unix_server(self.handle_client, path)
+        self.servers.append(server)
+        return server
+
+    def login(self, payload, writer):
+        """return the player of a login payload, or None to refuse it"""
+        try:
+            kind, fields = decode(payload)
+        except ValueError:
+            return None
+        if kind != "L":
+            return None
+        player_id, money, n_stock = fields
+        if not math.isfinite(money):
+            return None
+
+        player = self.ex.players.get(player_id)
+        if player is None:
+            player = RemotePlayer(player_id, money, n_stock, writer)
+            self.ex.add_player(player)
+            return player
+        if isinstance(player, RemotePlayer) and player.writer is None:
+            # Back after a disconnect
+            player.writer = writer
+            return player
+        # Connected already, or a player inside the ex
+        return None
+
+    async def handle_client(self, reader, writer):
+        payload = await read_frame(reader)
+        player = None if payload is None else self.login(payload, writer)
+        if player is None:
+            writer.close()
+            return
+        self.writers.add(writer)
+
+        try:
+            while (payload := await read_frame(reader)) is not None:
+                try:
+                    kind, fields = decode(payload)
+                except ValueError:
+                    # Can not trust the rest of the stream
+                    break
+                self.pending.append((player, kind, fields))
+        finally:
+            self.writers.discard(writer)
+            player.writer = None
+            self.pending.append((player, "X", ()))
+            writer.close()
+
+    def step(self):
+        """One tick. return the prices that changed."""
+        ex = self.ex
+        prices = dict(ex.final_prices)
+
+        ex.tick()
+
+        pending = self.pending
+        self.pending = []
+        self.n_message += len(pending)
+        offers = []
+        for player, kind, fields in pending:
+            if kind == "X":
+                offers.extend(player.cancel_all())
+            else:
+                offers.extend(player.apply(kind, fields))
+        if offers:
+            ex.add_offers(offers)
+
+        ex.deal()
+
+        return {symbol: price for symbol, price in ex.final_prices.items() if prices.get(symbol) != price}
+
+    async def publish(self, prices):
+        if prices:
+            message = b"".join(encode_price(self.ex.n_tick, price, symbol) for symbol, price in prices.items())
+            for writer in self.writers:
+                if not writer.is_closing():
+                    writer.write(message)
+
+        # Slow clients slow the ticks down instead of filling the memory
+        writers = list(self.writers)
+        results = await asyncio.gather(*(writer.drain() for writer in writers), return_exceptions=True)
+        for writer, result in zip(writers, results):
+            if isinstance(result, Exception):
+                self.writers.discard(writer)
+
+    async def run(self, n_tick=None):
+        loop = asyncio.get_running_loop()
+        while n_tick is None or n_tick > 0:
+            start = loop.time()
+            await self.publish(self.step())
+            if n_tick is not None:
+                n_tick -= 1
+            await asyncio.sleep(max(0, self.tick_interval - (loop.time() - start)))
+
+    async def close(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+
+class Client:
+    """A stand-in client of the gateway"""
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, player_id, money, n_stock, host="127.0.0.1", port=7000, path=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        writer.write(encode_login(player_id, money, n_stock))
+        return cls(reader, writer)
+
+    def new(self, order_id, direction, n_stock, price, symbol=DEFAULT_SYMBOL):
+        self.writer.write(encode_new(order_id, direction, n_stock, price, symbol))
+
+    def cancel(self, order_id):
+        self.writer.write(encode_cancel(order_id))
+
+    def amend(self, order_id, n_stock, price):
+        self.writer.write(encode_amend(order_id, n_stock, price))
+
+    async def flush(self):
+        await self.writer.drain()
+
+    async def receive(self):
+        """return the next (kind, fields) from the gateway. None when closed."""
+        payload = await read_frame(self.reader)
+        if payload is None:
+            return None
+        return decode(payload)
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+async def load_client(i, seconds, counts, **address):
+    """Random offers around the last price as fast as the gateway takes them"""
+    client = await Client.connect(f"load_{i}", 1_000_000_000, 1_000_000, **address)
+    last_price = 100.0
+
+    async def receive():
+        nonlocal last_price
+        while (message := await client.receive()) is not None:
+            kind, fields = message
+            if kind == "F":
+                counts["fills"] += 1
+            elif kind == "P":
+                last_price = fields[1]
+    receiver = asyncio.create_task(receive())
+
+    order_id = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            if order_id > 0 and random.random() < 0.3:
+                client.cancel(random.randrange(order_id))
+            else:
+                client.new(order_id, random.choice((Direction.BUY, Direction.SELL)),
+                           random.randint(1, 40), round(random.gauss(last_price, 2), 1))
+                order_id += 1
+        counts["messages"] += 100
+        await client.flush()
+        # Let the gateway tick
+        await asyncio.sleep(0)
+
+    await client.close()
+    receiver.cancel()
+
+async def load(n_client, seconds, tick_interval=0.01, **address):
+    """
+    Run n_client load clients for seconds.
+    Without an address, a gateway on a unix socket runs in this process too.
+    """
+    gateway = None
+    if not address:
+        gateway = Gateway(Ex(deal_log=NullDealLog(), link_log=False), tick_interval)
+        address = {"path": f"/tmp/gateway_{time.time_ns()}.sock"}
+        await gateway.serve_unix(address["path"])
+        ticker = asyncio.create_task(gateway.run())
+
+    counts = {"messages": 0, "fills": 0}
+    start = time.perf_counter()
+    await asyncio.gather(*(load_client(i, seconds, counts, **address) for i in range(n_client)))
+    elapsed = time.perf_counter() - start
+
+    print(f"clients={n_client} seconds={elapsed:.2f} "
+          f"messages/s={counts['messages'] / elapsed:,.0f} fills/s={counts['fills'] / elapsed:,.0f}")
+    if gateway is not None:
+        ticker.cancel()
+        await gateway.close()
+        os.remove(address["path"])
+        print(f"ticks={gateway.ex.n_tick} messages taken/s={gateway.n_message / elapsed:,.0f}")
+
+async def serve(tick_interval, port, path):
+    gateway = Gateway(Ex(), tick_interval)
+    if path is not None:
+        await gateway.serve_unix(path)
+    else:
+        await gateway.serve_tcp(port=port)
+    await gateway.run()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", choices=("serve", "load"))
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--unix", default=None, help="path of a unix socket instead of TCP")
+    parser.add_argument("--tick", type=float, default=0.01, help="seconds per tick")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        asyncio.run(serve(args.tick, args.port or 7000, args.unix))
+        return
+
+    address = {}
+    if args.unix is not None:
+        address["path"] = args.unix
+    elif args.port is not None:
+        address["port"] = args.port
+    asyncio.run(load(args.clients, args.seconds, args.tick, **address))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+from collections import deque
+import math
+
+# Prices are kept as integers of 1/SCALE, so the rolling sums never drift.
+# Two windows of the same prices always give the same mean.
+SCALE = 1_000_000
+
+class RollingWindow:
+    """The last `length` final prices, with the sums kept in O(1) per tick"""
+    def __init__(self, length):
+        self.length = length
+        self.values = deque([], length)
+        self.total = 0
+        self.total_sq = 0
+
+    def update(self, value):
+        values = self.values
+        if len(values) == self.length:
+            old = values[0]
+            self.total -= old
+            self.total_sq -= old * old
+        values.append(value)
+        self.total += value
+        self.total_sq += value * value
+
+    @property
+    def full(self):
+        return len(self.values) == self.length
+
+    @property
+    def sum(self):
+        return self.total / SCALE
+
+    @property
+    def mean(self):
+        return self.total / len(self.values) / SCALE
+
+    @property
+    def stdev(self):
+        """Population standard deviation. The volatility of the window."""
+        n = len(self.values)
+        variance = (self.total_sq * n - self.total * self.total) / (n * n)
+        return math.sqrt(variance) / SCALE
+
+class Indicators:
+    """
+    Indicators of the final price, shared by all players of an ex.
+    The ex updates them once per tick, before players decide.
+    Players subscribe to a window by its length and read it.
+    """
+    def __init__(self):
+        # length -> RollingWindow
+        self.windows = {}
+
+    def subscribe(self, length):
+        if length not in self.windows:
+            window = RollingWindow(length)
+            # Start with the history of the longest window
+            if self.windows:
+                longest = self.windows[max(self.windows)]
+                for value in list(longest.values)[-length:]:
+                    window.update(value)
+            self.windows[length] = window
+        return self.windows[length]
+
+    def update(self, price):
+        value = round(price * SCALE)
+        for window in self.windows.values():
+            window.update(value)
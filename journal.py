@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+The journal of the order flow of an ex: every offer given to add_offers,
+new or cancel, with its tick, the calls of deal, and the fills.
+
+    python run.py --journal flow.jnl --ticks 10000
+    python journal.py flow.jnl            # replay at full speed and check the fills
+
+A replay feeds the offers into a new Ex with stand-in players that do
+nothing but accept their deals, so it times the matching engine alone.
+The ex of a replay must be made as the journaled one (continuous, auction,
+price_band, book), or the fills differ. Players only: the offers of a
+cohort or a ledger are replayed as offers of one player.
+"""
+
+from offer import Direction, CompactOffer
+from player import Player
+from exchange import Ex
+from deallog import NullDealLog
+import argparse
+import json
+import struct
+import time
+
+MAGIC = b"SMJRNL01"
+
+# kind, tick, offer_id, player, side, n_stock, price, symbol, ttl (-1 for None).
+# A CANCEL has kind, tick, offer_id and player only.
+RECORD = struct.Struct("<BqqIbqdHi")
+
+NEW = 0
+CANCEL = 1
+# A call of deal. Only kind and tick.
+DEAL = 2
+# A fill. Only kind, tick, n_stock, price and symbol.
+FILL = 3
+
+DIRECTIONS = {Direction.BUY.value: Direction.BUY, Direction.SELL.value: Direction.SELL}
+
+class Journal:
+    """
+    Fixed-width records after an 8 bytes header, written through a buffer.
+    Players and symbols are written as their index. The names and the
+    portfolios at add_player are saved in the side file <file_name>.names on close.
+    """
+    def __init__(self, file_name, buffer_size=1 << 20):
+        self.file_name = file_name
+        self.output_file = open(file_name, 'wb')
+        self.output_file.write(MAGIC)
+        self.buffer = bytearray()
+        self.buffer_size = buffer_size
+
+        # player_id -> index, and [player_id, money, n_stock] of each index
+        self.player_index = {}
+        self.players = []
+        self.symbol_index = {}
+        self.symbols = []
+
+        # Offer IDs that are not int (uuid of Offer) -> a negative int
+        self.offer_ids = {}
+
+    def attach(self, ex):
+        ex.journal = self
+        ex.subscribe_fills(self.fill)
+
+    def add_player(self, player):
+        self.player_index[player.player_id] = len(self.players)
+        self.players.append([player.player_id, player.money, player.n_stock])
+
+    def offer_id(self, offer):
+        offer_id = offer.offer_id
+        if isinstance(offer_id, int):
+            return offer_id
+        if offer_id not in self.offer_ids:
+            self.offer_ids[offer_id] = -1 - len(self.offer_ids)
+        return self.offer_ids[offer_id]
+
+    def symbol(self, symbol):
+        if symbol not in self.symbol_index:
+            self.symbol_index[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return self.symbol_index[symbol]
+
+    def append(self, record):
+        self.buffer += record
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def new(self, tick, offer):
+        self.append(RECORD.pack(
+            NEW, tick, self.offer_id(offer), self.player_index[offer.player_id],
+            offer.direction.value, offer.n_stock, offer.price,
+            self.symbol(offer.symbol), -1 if offer.ttl is None else offer.ttl,
+        ))
+
+    def cancel(self, tick, offer):
+        self.append(RECORD.pack(CANCEL, tick, self.offer_id(offer), self.player_index[offer.player_id],
+                                0, 0, 0.0, 0, -1))
+
+    def deal(self, tick):
+        self.append(RECORD.pack(DEAL, tick, 0, 0, 0, 0, 0.0, 0, -1))
+
+    def fill(self, tick, symbol, n_stock, price):
+        self.append(RECORD.pack(FILL, tick, 0, 0, 0, n_stock, price, self.symbol(symbol), -1))
+
+    def flush(self):
+        self.output_file.write(self.buffer)
+        self.buffer.clear()
+
+    def close(self):
+        if self.output_file.closed:
+            return
+
+        self.flush()
+        self.output_file.close()
+
+        with open(f"{self.file_name}.names", 'w') as f:
+            json.dump({"players": self.players, "symbols": self.symbols}, f)
+
+def read_records(file_name, chunk_records=16_384):
+    """Yield the records of a journal as tuples. See RECORD."""
+    with open(file_name, 'rb') as f:
+        assert f.read(len(MAGIC)) == MAGIC, f"{file_name} is not a journal"
+
+        while chunk := f.read(RECORD.size * chunk_records):
+            yield from RECORD.iter_unpack(chunk)
+
+def read_names(file_name):
+    with open(f"{file_name}.names") as f:
+        return json.load(f)
+
+class ReplayPlayer(Player):
+    """Stands for a player of a journal. Never decides, takes every deal of its offers."""
+    def schedule(self, scheduler):
+        pass
+
+    def decide(self):
+        return []
+
+def load(file_name):
+    """
+    The journal as batches: (tick, offers) for each call of add_offers,
+    and (tick, None) for each call of deal. A call is the offers of one player
+    in a tick, as in Ex.tick. Offers are made here, before any timing.
+    Also return the fills: (tick, symbol, n_stock, price).
+    """
+    names = read_names(file_name)
+    player_ids = [player_id for player_id, _, _ in names["players"]]
+    symbols = names["symbols"]
+
+    batches = []
+    fills = []
+    # offer_id -> the offer made for it
+    offers = {}
+    batch = []
+    batch_tick = None
+    batch_player = None
+    for kind, tick, offer_id, player, side, n_stock, price, symbol, ttl in read_records(file_name):
+        if kind == FILL:
+            fills.append((tick, symbols[symbol], n_stock, price))
+            continue
+
+        if batch and (kind == DEAL or tick != batch_tick or player != batch_player):
+            batches.append((batch_tick, batch))
+            batch = []
+
+        if kind == DEAL:
+            batches.append((tick, None))
+        elif kind == NEW:
+            offer = CompactOffer(player_ids[player], DIRECTIONS[side], n_stock, price, offer_id,
+                                 symbols[symbol], None if ttl < 0 else ttl)
+            offers[offer_id] = offer
+            batch.append(offer)
+        else:
+            batch.append(offers[offer_id])
+        batch_tick = tick
+        batch_player = player
+
+    if batch:
+        batches.append((batch_tick, batch))
+    return names, batches, fills
+
+def replay(file_name, ex=None):
+    """
+    Feed a journal into ex (a new Ex by default) at full speed.
+    return (ex, fills of the replay, fills of the journal, seconds).
+    """
+    names, batches, journal_fills = load(file_name)
+
+    if ex is None:
+        ex = Ex(deal_log=NullDealLog(), link_log=False)
+    for symbol in names["symbols"]:
+        if symbol not in ex.books:
+            ex.add_symbol(symbol, deal_log=NullDealLog())
+    players = {}
+    for player_id, money, n_stock in names["players"]:
+        players[player_id] = ReplayPlayer(player_id, money, n_stock)
+        ex.add_player(players[player_id])
+
+    fills = []
+    ex.subscribe_fills(lambda *fill: fills.append(fill))
+
+    start = time.perf_counter()
+    for tick, offers in batches:
+        while ex.n_tick < tick:
+            ex.tick()
+
+        if offers is None:
+            ex.deal()
+            continue
+
+        # The book keeping of the player, as in decide:
+        # a cancel is the offer of its NEW record, a new offer is a new object.
+        for offer in offers:
+            outstanding_offer = players[offer.player_id].outstanding_offer
+            if offer in outstanding_offer:
+                outstanding_offer.remove(offer)
+            else:
+                outstanding_offer.add(offer)
+        ex.add_offers(offers)
+    seconds = time.perf_counter() - start
+
+    return ex, fills, journal_fills, seconds
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file_name")
+    parser.add_argument("--continuous", action="store_true")
+    parser.add_argument("--auction", action="store_true")
+    args = parser.parse_args()
+
+    ex = Ex(deal_log=NullDealLog(), link_log=False, continuous=args.continuous, auction=args.auction)
+    ex, fills, journal_fills, seconds = replay(args.file_name, ex)
+    n_offer = sum(len(offers) for _, offers in load(args.file_name)[1] if offers is not None)
+
+    print(f"ticks={ex.n_tick} offers={n_offer} fills={len(fills)} seconds={seconds:.3f} "
+          f"offers/s={n_offer / seconds:,.0f} fills/s={len(fills) / seconds:,.0f}")
+    if fills == journal_fills:
+        print("Fills are identical")
+    else:
+        print(f"Fills differ: {len(journal_fills)} in the journal")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+from offer import Direction, DEFAULT_SYMBOL
+from player import RandomWalker
+from deallog import format_player
+import numpy as np
+
+class Ledger:
+    """
+    Many agents as one player of the ex, with their state in arrays
+    indexed by agent: money (in cents), n_stock, strategy code and
+    the ID of the outstanding offer. About 27 bytes an agent.
+
+    Each agent has a handle (the ledger's handle + its index). Its offers
+    are HandleOffers with that handle, and account(offer) is the agent.
+
+    Agents are added in groups (add_agents) after the ledger is added to an ex.
+    An active group has a share of its agents decide in each tick, as
+    RandomWalkers drawn all at once. A passive group (active=0) only holds
+    its money and stock.
+    """
+    strategy = "Ledger"
+
+    def __init__(self, player_id, capacity, seed=None):
+        self.player_id = player_id
+        self.n_handles = capacity
+
+        self.n_agent = 0
+        self.money_cents = np.zeros(capacity, dtype=np.int64)
+        self.n_stocks = np.zeros(capacity, dtype=np.int64)
+        self.strategy_codes = np.zeros(capacity, dtype=np.int16)
+        self.outstanding = np.full(capacity, -1, dtype=np.int64)
+        # Up (1) or down (-1), as RandomWalker.price_direction
+        self.price_direction = np.ones(capacity, dtype=np.int8)
+
+        # strategy code -> name
+        self.strategies = []
+        # (first agent, end agent, share of the agents active in a tick)
+        self.groups = []
+
+        self.rng = np.random.default_rng(seed)
+
+        self.handle = None
+        self.ex = None
+
+    def assign_ex(self, ex):
+        self.ex = ex
+
+    @property
+    def money(self):
+        return int(self.money_cents.sum()) / 100
+
+    @property
+    def n_stock(self):
+        return int(self.n_stocks.sum())
+
+    @property
+    def positions(self):
+        # A ledger only trades the default symbol
+        return {DEFAULT_SYMBOL: self.n_stock}
+
+    def __repr__(self):
+        return f"ID:{self.player_id}\t${self.money:,.2f}\tN:{self.n_stock}\tagents:{self.n_agent}"
+
+    def add_agents(self, n_agent, money, n_stock, strategy, active=0.0):
+        """Add n_agent agents. return their indexes as a range."""
+        first = self.n_agent
+        end = first + n_agent
+        assert end <= self.n_handles, f"Ledger {self.player_id} is full"
+
+        if strategy not in self.strategies:
+            self.strategies.append(strategy)
+        code = self.strategies.index(strategy)
+
+        money_cents = round(money * 100)
+        self.money_cents[first:end] = money_cents
+        self.n_stocks[first:end] = n_stock
+        self.strategy_codes[first:end] = code
+        self.n_agent = end
+        self.groups.append((first, end, active))
+
+        self.ex.update_totals(LedgerAccount(self, first), money_cents * n_agent, n_stock * n_agent)
+        return range(first, end)
+
+    def strategy_totals(self):
+        """strategy -> (money, n_stock) of the agents"""
+        n = self.n_agent
+        codes = self.strategy_codes[:n]
+        money_cents = np.bincount(codes, weights=self.money_cents[:n], minlength=len(self.strategies))
+        n_stocks = np.bincount(codes, weights=self.n_stocks[:n], minlength=len(self.strategies))
+        return {
+            strategy: (float(money_cents[i]) / 100, int(n_stocks[i]))
+            for i, strategy in enumerate(self.strategies)
+        }
+
+    def schedule(self, scheduler):
+        scheduler.every(self, 1)
+
+    def account(self, offer):
+        return LedgerAccount(self, offer.handle - self.handle)
+
+    def clear_offers(self):
+        self.outstanding[:] = -1
+
+    def offer_expired(self, offer):
+        agent = offer.handle - self.handle
+        if self.outstanding[agent] == offer.offer_id:
+            self.outstanding[agent] = -1
+
+    def decide(self):
+        """Some agents of each active group act as RandomWalker.decide, all at once"""
+        final_price = self.ex.final_price
+        rng = self.rng
+        offers = []
+
+        for first, end, active in self.groups:
+            if not active:
+                continue
+            agents = first + rng.choice(end - first, rng.binomial(end - first, active), replace=False)
+            if len(agents) == 0:
+                continue
+
+            direction = self.price_direction[agents]
+            if final_price > RandomWalker.high_price:
+                direction[:] = -1
+            elif final_price < RandomWalker.low_price:
+                direction[:] = 1
+            self.price_direction[agents] = direction
+
+            sides = rng.choice((Direction.BUY.value, Direction.SELL.value), len(agents))
+            prices = np.round(rng.normal(final_price + direction * RandomWalker.drift, RandomWalker.price_sigma), 1)
+            # int() of RandomWalker truncates toward 0
+            n_stocks = np.trunc(rng.normal(RandomWalker.size_mean, RandomWalker.size_sigma, len(agents))).astype(np.int64)
+
+            # Cancel the old offers of the agents, then the new ones
+            live = self.ex.offers
+            for offer_id in self.outstanding[agents].tolist():
+                if offer_id >= 0 and offer_id in live:
+                    offers.append(live[offer_id])
+
+            new_offers = self.ex.new_offers(self.player_id, sides.tolist(), n_stocks.tolist(), prices.tolist(),
+                                            handles=(agents + self.handle).tolist())
+            if new_offers:
+                self.outstanding[agents] = np.arange(len(new_offers)) + new_offers[0].offer_id
+            offers.extend(new_offers)
+
+        return offers
+
+    def deal_done(self, offer, direction, n_stock, price):
+        return self.account(offer).deal_done(offer, direction, n_stock, price)
+
+class LedgerAccount:
+    """One agent of a ledger, seen as a player"""
+    __slots__ = ("ledger", "agent")
+
+    def __init__(self, ledger, agent):
+        self.ledger = ledger
+        self.agent = agent
+
+    @property
+    def player_id(self):
+        return f"{self.ledger.player_id}_{self.agent}"
+
+    @property
+    def handle(self):
+        return self.ledger.handle + self.agent
+
+    @property
+    def strategy(self):
+        ledger = self.ledger
+        return ledger.strategies[ledger.strategy_codes[self.agent]]
+
+    @property
+    def money(self):
+        return int(self.ledger.money_cents[self.agent]) / 100
+
+    @property
+    def n_stock(self):
+        return int(self.ledger.n_stocks[self.agent])
+
+    def __repr__(self):
+        return format_player(self.player_id, self.money, self.n_stock)
+
+    def deal_done(self, offer, direction, n_stock, price):
+        """Same as Player.deal_done, on the arrays"""
+        ledger = self.ledger
+        agent = self.agent
+
+        if ledger.outstanding[agent] != offer.offer_id:
+            return False
+
+        offer.n_stock -= n_stock
+
+        money_cents = round(round(n_stock * price, 2) * 100)
+        if direction == Direction.BUY:
+            ledger.n_stocks[agent] += n_stock
+            ledger.money_cents[agent] -= money_cents
+            ledger.ex.update_totals(self, -money_cents, n_stock)
+
+        if direction == Direction.SELL:
+            ledger.n_stocks[agent] -= n_stock
+            ledger.money_cents[agent] += money_cents
+            ledger.ex.update_totals(self, money_cents, -n_stock)
+
+        if offer.n_stock == 0:
+            ledger.outstanding[agent] = -1
+
+        return True
@@ -5,13 +5,23 @@ class Direction(Enum):
     BUY = 1
     SELL = -1
 
+# The symbol of offers made without one. The only symbol of a single symbol ex.
+DEFAULT_SYMBOL = "STOCK"
+
 class Offer():
-    def __init__(self, player_id, direction, n_stock, price):
+    __slots__ = ("player_id", "direction", "n_stock", "price", "offer_id", "symbol", "ttl")
+
+    def __init__(self, player_id, direction, n_stock, price, offer_id=None, symbol=DEFAULT_SYMBOL, ttl=None):
         self.player_id = player_id
         self.direction = direction
         self.n_stock   = n_stock
         self.price     = price
-        self.offer_id  = uuid.uuid4() # TODO: Should use UUID4? It is just random
+        if offer_id is None:
+            offer_id = uuid.uuid4() # TODO: Should use UUID4? It is just random
+        self.offer_id  = offer_id
+        self.symbol    = symbol
+        # Good for ttl ticks from the tick it is added. None for good till cancel.
+        self.ttl       = ttl
 
     def __repr__(self):
         return str(self.offer_id)
@@ -19,3 +29,25 @@ class Offer():
     def __str__(self):
         return f"ID:{self.offer_id} Player:{self.player_id} {self.direction} {self.n_stock} @${self.price:.2f}"
 
+class CompactOffer(Offer):
+    """
+    An offer made by the exchange (see Ex.new_offer).
+    offer_id is a sequential int given by the exchange instead of a UUID.
+    side is the direction as a small int: 1 for BUY, -1 for SELL.
+    """
+    __slots__ = ("side",)
+
+    def __init__(self, player_id, direction, n_stock, price, offer_id, symbol=DEFAULT_SYMBOL, ttl=None):
+        super().__init__(player_id, direction, n_stock, price, offer_id, symbol, ttl)
+        self.side = direction.value
+
+class HandleOffer(CompactOffer):
+    """
+    An offer of an agent of a ledger (see ledger.py).
+    player_id is the ledger's, handle is the agent's.
+    """
+    __slots__ = ("handle",)
+
+    def __init__(self, player_id, direction, n_stock, price, offer_id, handle, symbol=DEFAULT_SYMBOL):
+        super().__init__(player_id, direction, n_stock, price, offer_id, symbol)
+        self.handle = handle
@@ -1,15 +1,21 @@
-from offer import Direction, Offer
-from collections import deque
+from offer import Direction, Offer, DEFAULT_SYMBOL
 import random
 
 class Player:
+    # Number of handles taken in Ex.add_player
+    n_handles = 1
+
     def __init__(self, player_id, money, n_stock):
         self.player_id = player_id
         self.money = money
-        self.n_stock = n_stock
+        # symbol -> n_stock. n_stock is the one of the default symbol.
+        self.positions = {DEFAULT_SYMBOL: n_stock}
 
         self.outstanding_offer = set()
 
+        # Given by the ex in add_player
+        self.handle = None
+
         self.ex = None
         # A player may want to decide according to the ex's state.
         # A common consideration is the final price.
@@ -22,6 +28,41 @@ class Player:
     def __repr__(self):
         return f"ID:{self.player_id}\t${self.money:,.2f}\tN:{self.n_stock}"
 
+    @property
+    def n_stock(self):
+        return self.positions[DEFAULT_SYMBOL]
+
+    @n_stock.setter
+    def n_stock(self, n_stock):
+        self.positions[DEFAULT_SYMBOL] = n_stock
+
+    @property
+    def strategy(self):
+        # For the totals of each strategy in the ex
+        return type(self).__name__
+
+    def schedule(self, scheduler):
+        """
+        Tell the scheduler of the ex when to call decide.
+        Every tick by default.
+        """
+        scheduler.every(self, 1)
+
+    def account(self, offer):
+        """
+        Who deals for the offer.
+        Always the player itself. A cohort answers one of its members.
+        """
+        return self
+
+    def clear_offers(self):
+        # The ex drops all offers.
+        self.outstanding_offer.clear()
+
+    def offer_expired(self, offer):
+        # The ex drops the offer: its ttl is over, or the price is too far away.
+        self.outstanding_offer.discard(offer)
+
     def deal_done(self, offer, direction, n_stock, price):
         if offer in self.outstanding_offer:
             # No any check. Assume the caller is right.
@@ -29,20 +70,32 @@ class Player:
             # When a deal is done, the offer always become smaller.
             offer.n_stock -= n_stock
 
+            positions = self.positions
+            symbol = offer.symbol
+            money_before = self.money
+            n_stock_before = positions.get(symbol, 0)
+
             money = round(n_stock * price, 2)
             if direction == Direction.BUY:
-                self.n_stock += n_stock
+                positions[symbol] = n_stock_before + n_stock
                 self.money -= money
                 self.money = round(self.money, 2)
 
             if direction == Direction.SELL:
-                self.n_stock -= n_stock
+                positions[symbol] = n_stock_before - n_stock
                 self.money += money
                 self.money = round(self.money, 2)
 
             if offer.n_stock == 0:
                 self.outstanding_offer.remove(offer)
 
+            if self.ex is not None:
+                self.ex.update_totals(
+                    self,
+                    round(self.money * 100) - round(money_before * 100),
+                    positions[symbol] - n_stock_before,
+                )
+
             return True
         # If add checking, return False means the deal is wrong and nothing is changed here.
         return False
@@ -70,26 +123,36 @@ class Puppet(Player):
 
 
 class RandomWalker(Player):
+    # Parameters. Set on an instance to change one player (see sweep.py).
+    # Drift down above high_price, up below low_price.
+    high_price = 125
+    low_price = 75
+    drift = 0.5
+    price_sigma = 2
+    size_mean = 20
+    size_sigma = 6
+
     def __init__(self, player_id, money, n_stock):
         super().__init__(player_id, money, n_stock)
-        self.price_direction = 0.5
+        # Up (1) or down (-1), by drift
+        self.price_direction = 1
 
     def decide(self):
         direction = random.choice((Direction.BUY, Direction.SELL))
         final_price = self.ex.final_price
 
         #if final_price > 200:
-        if final_price > 125:
+        if final_price > self.high_price:
             #self.price_direction = -0.1
-            self.price_direction = -0.5
+            self.price_direction = -1
         #elif final_price < 50:
-        elif final_price < 75:
+        elif final_price < self.low_price:
             #self.price_direction = 0.1
-            self.price_direction = 0.5
+            self.price_direction = 1
 
-        price = round(random.gauss(final_price+self.price_direction, 2), 1)
-        n_stock = int(random.gauss(20, 6))
-        offer = Offer(self.player_id, direction, n_stock, price)
+        price = round(random.gauss(final_price+self.price_direction*self.drift, self.price_sigma), 1)
+        n_stock = int(random.gauss(self.size_mean, self.size_sigma))
+        offer = self.ex.new_offer(self.player_id, direction, n_stock, price)
 
         # Add a new offer
         my_offers = [offer]
@@ -104,24 +167,33 @@ class RandomWalker(Player):
         return my_offers
 
 class ValueInvestor(Player):
+    # Parameters. Buy below low_price, sell above high_price, lot shares at a time.
+    low_price = 80
+    high_price = 120
+    lot = 500
+
     #def __init__(self, player_id, money, n_stock):
     #    super().__init__(player_id, money, n_stock)
     #    self.idle_count = 0
 
+    def schedule(self, scheduler):
+        # Nothing to do when the price is between low_price and high_price
+        scheduler.price_outside(self, self.low_price, self.high_price)
+
     def decide(self):
 
         final_price = self.ex.final_price
 
         offer = None
 
-        n_stock = 500
+        n_stock = self.lot
 
-        if final_price < 80 and self.money > final_price * n_stock:
-            offer = Offer(self.player_id, Direction.BUY, n_stock, final_price)
+        if final_price < self.low_price and self.money > final_price * n_stock:
+            offer = self.ex.new_offer(self.player_id, Direction.BUY, n_stock, final_price)
             #offer = Offer(self.player_id, Direction.BUY, n_stock, 80)
 
-        if final_price > 120 and self.n_stock > n_stock:
-            offer = Offer(self.player_id, Direction.SELL, n_stock, final_price)
+        if final_price > self.high_price and self.n_stock > n_stock:
+            offer = self.ex.new_offer(self.player_id, Direction.SELL, n_stock, final_price)
             #offer = Offer(self.player_id, Direction.SELL, n_stock, 120)
 
         if offer:
@@ -141,43 +213,60 @@ class ValueInvestor(Player):
         return []
 
 class TrendFollower(Player):
+    # Parameters. Follow the short moving average against the long one.
+    # Gain risk by small_lot, release it by large_lot, within the positions.
+    short_window = 5
+    long_window = 10
+    small_lot = 1000
+    large_lot = 3000
+    max_position = 3_000
+    min_position = -1_000
+
     def __init__(self, player_id, money, n_stock):
         super().__init__(player_id, money, n_stock)
-        self.five_ticks = deque([], 5)
-        self.ten_ticks = deque([], 10)
+        # Moving averages of the final price, shared in ex.indicators
+        self.five_ticks = None
+        self.ten_ticks = None
+
+    def assign_ex(self, ex):
+        super().assign_ex(ex)
+        # The longer first, so the shorter one starts with its history
+        self.ten_ticks = ex.indicators.subscribe(self.long_window)
+        self.five_ticks = ex.indicators.subscribe(self.short_window)
+
+    def schedule(self, scheduler):
+        # Nothing to do until the long window is full
+        scheduler.every(self, 1, start=self.ex.n_tick + self.long_window - len(self.ten_ticks.values))
 
     def decide(self):
         final_price = self.ex.final_price
-        self.five_ticks.append(final_price)
-        self.ten_ticks.append(final_price)
 
-        if len(self.five_ticks) < 5 or len(self.ten_ticks) < 10:
+        if not self.five_ticks.full or not self.ten_ticks.full:
             return []
 
         # Have enough data, start trading
         n_stock = 1
         direction = None
-        if sum(self.five_ticks) > sum(self.ten_ticks) / 2:
+        if self.five_ticks.mean > self.ten_ticks.mean:
             # Gain risk slow, release risk fast
             if self.n_stock > 0:
-                n_stock = 1000
+                n_stock = self.small_lot
             else:
-                n_stock = 3000
+                n_stock = self.large_lot
             direction = Direction.BUY
-        elif sum(self.five_ticks) < sum(self.ten_ticks) / 2:
+        elif self.five_ticks.mean < self.ten_ticks.mean:
             if self.n_stock > 0:
-                n_stock = 3000
+                n_stock = self.large_lot
             else:
-                n_stock = 1000
+                n_stock = self.small_lot
             direction = Direction.SELL
         else:
             direction = None
 
         # Risk position control
-        n_stock_max = 3_000
-        if direction == Direction.BUY and self.n_stock > n_stock_max:
+        if direction == Direction.BUY and self.n_stock > self.max_position:
             direction = None
-        if direction == Direction.SELL and self.n_stock < -1_000:
+        if direction == Direction.SELL and self.n_stock < self.min_position:
             direction = None
 
         # No direction. Cancel all offers if there is any.
@@ -186,7 +275,7 @@ class TrendFollower(Player):
             self.outstanding_offer.clear()
             return cancel_offers
 
-        offer = Offer(self.player_id, direction, n_stock, final_price)
+        offer = self.ex.new_offer(self.player_id, direction, n_stock, final_price)
 
         # Add a new offer
         my_offers = [offer]
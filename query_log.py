@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+from deallog import MAGIC, RECORD, read_players
+from array import array
+import argparse
+import bisect
+import heapq
+import mmap
+import os
+import pickle
+
+class DealIndex:
+    """
+    Side index of a binary deal log, saved as <file_name>.idx
+
+    player_records: handle -> record numbers (ascending) the player is in
+    ticks, tick_records: record number of the first deal of each tick
+    size: size of the log when indexed. A different size means a stale index.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.player_records = {}
+        self.ticks = array('q')
+        self.tick_records = array('Q')
+
+    def record_range(self, tick_from=None, tick_to=None):
+        """[begin, end) of the record numbers between tick_from and tick_to (both included)"""
+        begin = 0
+        end = (self.size - len(MAGIC)) // RECORD.size
+        if tick_from is not None:
+            i = bisect.bisect_left(self.ticks, tick_from)
+            begin = self.tick_records[i] if i < len(self.ticks) else end
+        if tick_to is not None:
+            i = bisect.bisect_right(self.ticks, tick_to)
+            end = self.tick_records[i] if i < len(self.ticks) else end
+        return begin, end
+
+def index_name(file_name):
+    return f"{os.path.realpath(file_name)}.idx"
+
+def build_index(file_name):
+    size = os.path.getsize(file_name)
+    index = DealIndex(size)
+
+    with open(file_name, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                body = view[len(MAGIC):size - (size - len(MAGIC)) % RECORD.size]
+                index_records(index, body)
+                body.release()
+
+    with open(index_name(file_name), 'wb') as f:
+        # A plain dict. It can be loaded no matter who built it.
+        pickle.dump(vars(index), f)
+
+    return index
+
+def index_records(index, body):
+    player_records = index.player_records
+    last_tick = None
+    for i, (tick, buyer, seller, *_) in enumerate(RECORD.iter_unpack(body)):
+        if tick != last_tick:
+            index.ticks.append(tick)
+            index.tick_records.append(i)
+            last_tick = tick
+
+        if buyer not in player_records:
+            player_records[buyer] = array('Q')
+        player_records[buyer].append(i)
+        if seller != buyer:
+            if seller not in player_records:
+                player_records[seller] = array('Q')
+            player_records[seller].append(i)
+
+def load_index(file_name):
+    """Load the side index. Build it if it is missing or stale."""
+    try:
+        with open(index_name(file_name), 'rb') as f:
+            index = DealIndex(0)
+            vars(index).update(pickle.load(f))
+        if index.size == os.path.getsize(file_name):
+            return index
+    except FileNotFoundError:
+        pass
+
+    return build_index(file_name)
+
+def query(file_name, player_ids, tick_from=None, tick_to=None):
+    """
+    Yield the deals of the players between tick_from and tick_to (both included),
+    in the order of the log:
+    (record number, tick, player_id, 'B' or 'S', money, n_stock, deal n_stock, price)
+    money and n_stock are the player's after the deal.
+    """
+    index = load_index(file_name)
+    names = read_players(file_name)
+    handles = {player_id: handle for handle, player_id in names.items()}
+
+    begin, end = index.record_range(tick_from, tick_to)
+
+    def records_of(handle):
+        records = index.player_records.get(handle, ())
+        lo = bisect.bisect_left(records, begin)
+        hi = bisect.bisect_left(records, end)
+        for i in range(lo, hi):
+            yield records[i]
+
+    wanted = {handles[player_id] for player_id in player_ids if player_id in handles}
+    streams = [records_of(handle) for handle in wanted]
+
+    with open(file_name, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            last_i = -1
+            for i in heapq.merge(*streams):
+                if i == last_i:
+                    # Both the buyer and the seller are wanted
+                    continue
+                last_i = i
+
+                tick, buyer, seller, n_stock, price, buyer_money, buyer_n_stock, seller_money, seller_n_stock = \
+                    RECORD.unpack_from(mm, len(MAGIC) + i * RECORD.size)
+
+                if buyer in wanted:
+                    yield i, tick, names[buyer], 'B', buyer_money, buyer_n_stock, n_stock, price
+                if seller in wanted:
+                    yield i, tick, names[seller], 'S', seller_money, seller_n_stock, n_stock, price
+
+def main():
+    parser = argparse.ArgumentParser(description="Deals of some players in a binary deal log")
+    parser.add_argument("player_ids", nargs="+")
+    parser.add_argument("--log", default="deal.log")
+    parser.add_argument("--from", dest="tick_from", type=int)
+    parser.add_argument("--to", dest="tick_to", type=int)
+    args = parser.parse_args()
+
+    for i, tick, player_id, side, money, n_stock, deal_n_stock, price in query(args.log, args.player_ids, args.tick_from, args.tick_to):
+        print(f'{i}\t{tick}\t{player_id}\t${money:,.2f}\tN:{n_stock}\t{side}\t{deal_n_stock}\t{price}')
+
+if __name__ == "__main__":
+    main()
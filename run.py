@@ -2,58 +2,193 @@
 
 from offer import Direction, Offer
 from player import RandomWalker, ValueInvestor, TrendFollower
+from cohort import RandomWalkerCohort
 from exchange import Ex
+from deallog import BinaryDealLog, NullDealLog, ThreadedDealLog
+from journal import Journal
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import json
+import random
+import statistics
 
-def add_players(ex):
-    for i in range(1,21):
-        portfolio = {
-            "player_id" : f"rand_{i}",
-            "money"     : 0,
-            "n_stock"   : 0,
-            #"money"     : 1_000_000 + i,
-            #"n_stock"   : 2_000 + i,
-        }
-        p = RandomWalker(**portfolio)
-        ex.add_player(p)
-
-    portfolio = {
-        "player_id" : f"val_1",
-        "money"     : 1_000_000_000,
-        "n_stock"   : 2_000,
-    }
-    p = ValueInvestor(**portfolio)
-    ex.add_player(p)
-
-    #portfolio = {
-    #    "player_id" : f"trend_1",
-    #    "money"     : 1_000_000,
-    #    "n_stock"   : 2_000,
-    #}
-    #p = TrendFollower(**portfolio)
+# strategy -> (class, prefix of player_id, money, n_stock) of each player
+STRATEGIES = {
+    "RandomWalker": (RandomWalker, "rand", 0, 0),
+    #"RandomWalker": (RandomWalker, "rand", 1_000_000, 2_000),
+    "ValueInvestor": (ValueInvestor, "val", 1_000_000_000, 2_000),
+    "TrendFollower": (TrendFollower, "trend", 1_000_000, 2_000),
+}
+
+# strategy -> number of players
+POPULATION = {
+    "RandomWalker": 20,
+    "ValueInvestor": 1,
+    "TrendFollower": 0,
+}
+
+def add_players(ex, population=None, params=None):
+    """
+    population: strategy -> number of players. POPULATION by default.
+    params: "strategy.attribute" -> value, set on each player of the strategy,
+    e.g. {"RandomWalker.high_price": 130}. See the parameters of the strategies.
+    """
+    if population is None:
+        population = POPULATION
+    if params is None:
+        params = {}
+
+    for strategy, n_player in population.items():
+        cls, prefix, money, n_stock = STRATEGIES[strategy]
+        for i in range(1, n_player + 1):
+            portfolio = {
+                "player_id" : f"{prefix}_{i}",
+                "money"     : money,
+                "n_stock"   : n_stock,
+            }
+            p = cls(**portfolio)
+            # Before add_player, since the schedule may use them
+            for name, value in params.items():
+                param_strategy, attribute = name.split(".")
+                if param_strategy == strategy:
+                    if not hasattr(p, attribute):
+                        raise ValueError(f"{strategy} has no parameter {attribute}")
+                    setattr(p, attribute, value)
+            ex.add_player(p)
+
+    # Many RandomWalkers as one player. Decide by NumPy.
+    #p = RandomWalkerCohort("rand_cohort", 100_000, 0, 0)
     #ex.add_player(p)
 
-def main():
-    ex = Ex()
-    add_players(ex)
+def simulate(seed, n_tick=10000, deal_log=None, instrument=False, population=None, params=None, journal=None):
+    """
+    One run of n_tick ticks. Return a short summary.
+    With deal_log None, nothing is written to the disk,
+    so many runs can go at the same time.
+    population and params: see add_players.
+    journal: a Journal to record the order flow, or None.
+    """
+    random.seed(seed)
+
+    if deal_log is None:
+        ex = Ex(deal_log=NullDealLog(), link_log=False, instrument=instrument, journal=journal)
+    else:
+        ex = Ex(deal_log=deal_log, instrument=instrument, journal=journal)
+    add_players(ex, population, params)
 
     all_n_stock_before = ex.all_players_n_stock()
     all_money_before = ex.all_players_money()
 
     no_deal_count = 0
-    for _ in range(10000):
+    prices = []
+    for _ in range(n_tick):
         ex.tick()
         #ex.print_offers()
         d = ex.deal()
         if not d:
             no_deal_count += 1
+        prices.append(ex.final_price)
 
     all_n_stock_after = ex.all_players_n_stock()
     all_money_after = ex.all_players_money()
 
+    # The binary log keeps a buffer. Don't wait for Ex.__del__,
+    # the file may have been finalized at exit already.
+    ex.close()
+
+    summary = {
+        "seed": seed,
+        "no_deal_count": no_deal_count,
+        "all_n_stock_before": all_n_stock_before,
+        "all_n_stock_after": all_n_stock_after,
+        "all_money_before": all_money_before,
+        "all_money_after": all_money_after,
+        "n_stock_ok": all_n_stock_before == all_n_stock_after,
+        "money_ok": all_money_before == all_money_after,
+        "price_last": prices[-1],
+        "price_min": min(prices),
+        "price_max": max(prices),
+        "price_mean": statistics.fmean(prices),
+        "price_stdev": statistics.pstdev(prices),
+    }
+    if instrument:
+        summary["stats"] = ex.stats_snapshot()
+
+    return summary
+
+def monte_carlo(n_run, n_tick=10000, seed=0, max_workers=None):
+    """
+    Run n_run independent simulations in a process pool.
+    Run i uses seed + i. Yield (summary, aggregate) as each run finishes.
+    """
+    aggregate = {
+        "n_run": 0,
+        "n_stock_ok": 0,
+        "money_ok": 0,
+        "no_deal_count": [],
+        "price_last": [],
+        "price_stdev": [],
+    }
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(simulate, seed + i, n_tick) for i in range(n_run)]
+        for future in as_completed(futures):
+            summary = future.result()
+
+            aggregate["n_run"] += 1
+            aggregate["n_stock_ok"] += summary["n_stock_ok"]
+            aggregate["money_ok"] += summary["money_ok"]
+            for key in ("no_deal_count", "price_last", "price_stdev"):
+                aggregate[key].append(summary[key])
+
+            yield summary, aggregate
+
+def print_distribution(name, values):
+    if len(values) > 1:
+        print(f"{name}: mean={statistics.fmean(values):.2f} stdev={statistics.stdev(values):.2f} min={min(values)} max={max(values)}")
+    else:
+        print(f"{name}: {values[0]}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=0, help="Monte Carlo runs. 0 for one run with deal log")
+    parser.add_argument("--ticks", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--stats", action="store_true", help="Time each phase of the ex")
+    parser.add_argument("--log-thread", action="store_true", help="Write the deal log in a writer thread")
+    parser.add_argument("--journal", default=None, help="Record the order flow to this file. Replay it by journal.py")
+    args = parser.parse_args()
+
+    if args.runs:
+        seed = args.seed if args.seed is not None else random.randrange(2**32)
+        for summary, aggregate in monte_carlo(args.runs, args.ticks, seed, args.workers):
+            print(f"seed={summary['seed']} no_deal_count={summary['no_deal_count']} "
+                  f"price_last={summary['price_last']} n_stock_ok={summary['n_stock_ok']} money_ok={summary['money_ok']}")
+
+        print(f"===== {aggregate['n_run']} runs =====")
+        print(f"n_stock_ok={aggregate['n_stock_ok']} money_ok={aggregate['money_ok']}")
+        print_distribution("no_deal_count", aggregate["no_deal_count"])
+        print_distribution("price_last", aggregate["price_last"])
+        print_distribution("price_stdev", aggregate["price_stdev"])
+        return
+
+    # Binary deal log. Read it by transform_log.py or deallog.py
+    deal_log = BinaryDealLog()
+    if args.log_thread:
+        deal_log = ThreadedDealLog(deal_log)
+    journal = Journal(args.journal) if args.journal else None
+    summary = simulate(args.seed, args.ticks, deal_log, args.stats, journal=journal)
+
     # For code checking
-    print(f"{no_deal_count=}")
-    print(f"{all_n_stock_before=} {all_n_stock_after=}")
-    print(f"{all_money_before=} {all_money_after=}")
+    print(f"no_deal_count={summary['no_deal_count']}")
+    print(f"all_n_stock_before={summary['all_n_stock_before']} all_n_stock_after={summary['all_n_stock_after']}")
+    print(f"all_money_before={summary['all_money_before']} all_money_after={summary['all_money_after']}")
+
+    if args.stats:
+        print(json.dumps(summary["stats"], indent=2))
+    if args.log_thread:
+        print(json.dumps(deal_log.metrics(), indent=2))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+import bisect
+
+class Scheduler:
+    """
+    Who should decide in a tick.
+
+    A player declares when to wake up (see Player.schedule):
+    every(k): every k ticks
+    price_outside(low, high): every tick while the final price is below low or above high
+    on_fill: the tick after a deal is done on one of its offers
+
+    Ex.tick asks due() for the players to call, so an idle player costs nothing.
+    """
+    def __init__(self):
+        # Players of every(1)
+        self.always = []
+
+        # tick -> [(player, k)] of every(k). A timing wheel without the wheel.
+        self.wheel = {}
+
+        # Sorted by the threshold. keys for bisect, players in the same order.
+        self.low_keys = []
+        self.low_players = []
+        self.high_keys = []
+        self.high_players = []
+
+        self.fill_subscribers = set()
+        # dict as an ordered set
+        self.filled_players = {}
+
+        self.n_tick = 0
+
+    def every(self, player, k=1, start=None):
+        """Wake at tick start (the next tick by default), then every k ticks"""
+        if start is None or start <= self.n_tick + 1:
+            if k == 1:
+                self.always.append(player)
+                return
+            start = self.n_tick + 1
+        self.wheel.setdefault(start, []).append((player, k))
+
+    def price_outside(self, player, low, high):
+        """Wake in every tick that the final price is < low or > high"""
+        i = bisect.bisect_right(self.low_keys, low)
+        self.low_keys.insert(i, low)
+        self.low_players.insert(i, player)
+
+        i = bisect.bisect_right(self.high_keys, high)
+        self.high_keys.insert(i, high)
+        self.high_players.insert(i, player)
+
+    def on_fill(self, player):
+        self.fill_subscribers.add(player)
+
+    def filled(self, player):
+        """Called by the ex when a deal is done for the player"""
+        if player in self.fill_subscribers:
+            self.filled_players[player] = None
+
+    def due(self, n_tick, price):
+        """The players to wake in tick n_tick. Each player once."""
+        self.n_tick = n_tick
+
+        due = dict.fromkeys(self.always)
+
+        for player, k in self.wheel.pop(n_tick, ()):
+            due[player] = None
+            if k == 1:
+                self.always.append(player)
+            else:
+                self.wheel.setdefault(n_tick + k, []).append((player, k))
+
+        # price < low
+        for player in self.low_players[bisect.bisect_right(self.low_keys, price):]:
+            due[player] = None
+        # price > high
+        for player in self.high_players[:bisect.bisect_left(self.high_keys, price)]:
+            due[player] = None
+
+        if self.filled_players:
+            due.update(self.filled_players)
+            self.filled_players.clear()
+
+        return list(due)
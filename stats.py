@@ -0,0 +1,89 @@
+from collections import defaultdict
+import json
+import sys
+import time
+
+class Stats:
+    """
+    Wall time and counters of the phases of an Ex.
+
+    The methods of the ex are wrapped by timers only when attached,
+    so an ex without Stats runs the plain methods and pays nothing.
+
+    seconds is the self time of each phase: the time of the nested phases
+    is not counted again. So "tick" is the shuffle plus the decide of players,
+    without the add_offers called inside it.
+    """
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+
+        # Time spent in nested phases, one slot for each running phase
+        self.stack = [0.0]
+
+    def timed(self, phase, func, count=None):
+        """
+        Wrap func as a phase.
+        count(result) returns the counters to add after each call.
+        """
+        seconds = self.seconds
+        calls = self.calls
+        counters = self.counters
+        stack = self.stack
+        perf_counter = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            stack.append(0.0)
+            start = perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                seconds[phase] += elapsed - stack.pop()
+                stack[-1] += elapsed
+                calls[phase] += 1
+
+            if count is not None:
+                for name, n in count(result, *args):
+                    counters[name] += n
+            return result
+
+        return wrapper
+
+    def attach(self, ex):
+        ex.tick = self.timed("tick", ex.tick)
+        ex.add_offers = self.timed("add_offers", ex.add_offers,
+                                   lambda result, offers: (("offers", len(offers)),))
+        ex.cancel_offer = self.timed("cancel_offer", ex.cancel_offer,
+                                     lambda result, offer_id: (("cancels", 1),))
+        # A call looks at the best level of one side
+        ex.best_offers = self.timed("best_offers", ex.best_offers,
+                                    lambda result, *args: (("levels_scanned", 1),))
+        ex.deal = self.timed("deal", ex.deal)
+        ex.deal_parallel = self.timed("deal_parallel", ex.deal_parallel)
+        ex.deal_one_price = self.timed("deal_one_price", ex.deal_one_price)
+        ex.uncross = self.timed("uncross", ex.uncross)
+        ex.deal_one_pair = self.timed("deal_one_pair", ex.deal_one_pair)
+        # Every fill goes through settle, in all the modes
+        ex.settle = self.timed("settle", ex.settle, lambda result, *args: (("fills", 1),))
+        for deal_log in ex.deal_logs.values():
+            self.attach_deal_log(deal_log)
+
+    def attach_deal_log(self, deal_log):
+        """Also called by Ex.add_symbol for the deal logs of later symbols"""
+        deal_log.write = self.timed("deal_log", deal_log.write,
+                                    lambda result, *args: (("bytes_logged", result),))
+
+    def snapshot(self):
+        return {
+            "seconds": dict(self.seconds),
+            "calls": dict(self.calls),
+            "counters": dict(self.counters),
+        }
+
+    def dump(self, file=None):
+        if file is None:
+            file = sys.stdout
+        json.dump(self.snapshot(), file, indent=2)
+        file.write("\n")
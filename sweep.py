@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Run simulate over a grid of strategy parameters, populations and seeds.
+
+    python sweep.py --param RandomWalker.high_price=120,125,130 \
+                    --param ValueInvestor.lot=100,500 \
+                    --population RandomWalker=20,ValueInvestor=1 \
+                    --population RandomWalker=20,ValueInvestor=1,TrendFollower=1 \
+                    --seeds 4 --ticks 2000 --output sweep.jsonl
+
+Each point of the grid runs in a process pool. Its summary is cached on disk
+under a hash of (parameters, population, seed, ticks, engine version), so a
+larger grid only runs the new points. The engine version is a hash of the
+source of the engine and the strategies: a change to them runs everything again.
+"""
+
+from run import simulate, POPULATION
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import hashlib
+import itertools
+import json
+import os
+
+# The modules that decide the result of a run
+ENGINE_MODULES = (
+    "book.py", "cohort.py", "exchange.py", "indicators.py",
+    "offer.py", "player.py", "run.py", "scheduler.py",
+)
+
+def engine_version():
+    h = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in ENGINE_MODULES:
+        with open(os.path.join(directory, name), 'rb') as f:
+            h.update(name.encode())
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+def grid(params):
+    """{name: [values]} -> [{name: value}] of all the combinations"""
+    names = sorted(params)
+    return [dict(zip(names, values)) for values in itertools.product(*(params[name] for name in names))]
+
+def point_key(point, version):
+    text = json.dumps({"point": point, "version": version}, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class ResultCache:
+    """One JSON file per point: <directory>/<key[:2]>/<key>.json"""
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self.path(key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, result):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a killed sweep leaves no half file
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp, path)
+
+def run_point(point):
+    return simulate(point["seed"], point["n_tick"], population=point["population"], params=point["params"])
+
+def sweep(params, populations=None, seeds=(0,), n_tick=10000, cache_dir=".sweep_cache", max_workers=None):
+    """
+    Yield (point, summary, cached) for every combination of
+    params ({"strategy.attribute": [values]}), populations and seeds.
+    Points not in the cache run in a process pool, and are yielded as they finish.
+    """
+    if populations is None:
+        populations = [POPULATION]
+
+    version = engine_version()
+    cache = ResultCache(cache_dir)
+
+    points = [
+        {"params": param_values, "population": population, "seed": seed, "n_tick": n_tick}
+        for param_values in grid(params)
+        for population in populations
+        for seed in seeds
+    ]
+
+    to_run = []
+    for point in points:
+        key = point_key(point, version)
+        summary = cache.get(key)
+        if summary is None:
+            to_run.append((key, point))
+        else:
+            yield point, summary, True
+
+    if not to_run:
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_point, point): (key, point) for key, point in to_run}
+        for future in as_completed(futures):
+            key, point = futures[future]
+            summary = future.result()
+            cache.put(key, summary)
+            yield point, summary, False
+
+def parse_value(text):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+def parse_param(text):
+    """RandomWalker.high_price=120,125 -> ("RandomWalker.high_price", [120, 125])"""
+    name, values = text.split("=", 1)
+    return name, [parse_value(value) for value in values.split(",")]
+
+def parse_population(text):
+    """RandomWalker=20,ValueInvestor=1 -> {"RandomWalker": 20, "ValueInvestor": 1}"""
+    population = {}
+    for item in text.split(","):
+        strategy, n_player = item.split("=")
+        population[strategy] = int(n_player)
+    return population
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--param", action="append", default=[], help="strategy.attribute=value,value,...")
+    parser.add_argument("--population", action="append", default=[], help="strategy=n,strategy=n,...")
+    parser.add_argument("--seeds", type=int, default=1, help="seeds 0 to n - 1 for each point")
+    parser.add_argument("--ticks", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache", default=".sweep_cache")
+    parser.add_argument("--output", default=None, help="JSON lines of the points and summaries")
+    args = parser.parse_args()
+
+    params = dict(parse_param(text) for text in args.param)
+    populations = [parse_population(text) for text in args.population] or None
+
+    output = open(args.output, 'w') if args.output else None
+    n_cached = 0
+    n_run = 0
+    for point, summary, cached in sweep(params, populations, range(args.seeds), args.ticks, args.cache, args.workers):
+        if cached:
+            n_cached += 1
+        else:
+            n_run += 1
+        print(f"{'cached' if cached else 'ran   '} {json.dumps(point['params'])} {json.dumps(point['population'])} "
+              f"seed={point['seed']} price_last={summary['price_last']} price_stdev={summary['price_stdev']:.2f}")
+        if output is not None:
+            output.write(json.dumps({"point": point, "summary": summary}) + "\n")
+
+    if output is not None:
+        output.close()
+    print(f"ran={n_run} cached={n_cached}")
+
+if __name__ == "__main__":
+    main()
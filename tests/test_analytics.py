@@ -0,0 +1,63 @@
+from analytics import DealHistory, grouped_cumsum
+from exchange import Ex
+from deallog import BinaryDealLog, read_deals, read_players
+from player import RandomWalker, ValueInvestor
+
+import numpy as np
+import random
+
+def test_grouped_cumsum():
+    values = np.array([1, 2, 3, 4, 5])
+    assert grouped_cumsum(values, np.array([0, 2, 3])).tolist() == [1, 3, 3, 4, 9]
+
+def test_deal_history(tmp_path):
+    file_name = tmp_path / "deal.bin"
+    random.seed(4)
+    ex = Ex(deal_log=BinaryDealLog(file_name), link_log=False)
+    for i in range(1, 6):
+        ex.add_player(RandomWalker(f"rand_{i}", 0, 0))
+    ex.add_player(ValueInvestor("val_1", 1_000_000_000, 2_000))
+    for _ in range(500):
+        ex.tick()
+        ex.deal()
+    ex.close()
+
+    history = DealHistory(file_name)
+    summary = history.player_summary()
+
+    # The same totals by a loop over the records
+    names = read_players(file_name)
+    bought = {}
+    sold = {}
+    cash = {}
+    last_price = None
+    for tick, buyer, seller, n_stock, price, *_ in read_deals(file_name):
+        buyer = names[buyer]
+        seller = names[seller]
+        bought[buyer] = bought.get(buyer, 0) + n_stock
+        sold[seller] = sold.get(seller, 0) + n_stock
+        cash[buyer] = cash.get(buyer, 0) - n_stock * price
+        cash[seller] = cash.get(seller, 0) + n_stock * price
+        last_price = price
+
+    assert history.n_deal > 100
+    assert history.last_price == last_price
+    for i, player_id in enumerate(summary["player_id"]):
+        player = ex.players[player_id]
+        assert summary["bought"][i] == bought.get(player_id, 0)
+        assert summary["sold"][i] == sold.get(player_id, 0)
+        assert summary["position"][i] == player.n_stock
+        assert summary["money"][i] == player.money
+
+        open_n_stock = bought.get(player_id, 0) - sold.get(player_id, 0)
+        pnl = cash[player_id] + open_n_stock * last_price
+        assert abs(summary["pnl"][i] - pnl) < 1e-6
+
+        ticks, positions = history.position_path(player_id)
+        assert positions[-1] == player.n_stock
+        assert (np.diff(ticks) >= 0).all()
+
+    strategies = history.strategy_summary()
+    assert set(strategies) == {"rand", "val"}
+    assert strategies["rand"]["n_player"] == 5
+    assert abs(sum(totals["pnl"] for totals in strategies.values())) < 1e-6
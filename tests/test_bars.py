@@ -0,0 +1,57 @@
+from bars import BarBuilder
+from exchange import Ex
+from deallog import NullDealLog
+from player import Puppet
+from offer import Direction
+
+import io
+import random
+from collections import deque
+
+def test_bars():
+    builder = BarBuilder((1, 10))
+    for tick, n_stock, price in ((1, 10, 100.0), (1, 5, 101.0), (3, 5, 99.0), (12, 1, 98.0)):
+        builder.on_fill(tick, "STOCK", n_stock, price)
+    builder.flush()
+
+    bars = builder.bars(1)
+    assert len(bars) == 3
+    assert bars[0] == (1, 100.0, 101.0, 100.0, 101.0, 15, (1000 + 505) / 15)
+    assert bars[1][0] == 3
+
+    bars = builder.bars(10)
+    assert [bar[0] for bar in (bars[0], bars[1])] == [0, 10]
+    assert bars[0][1:6] == (100.0, 101.0, 99.0, 99.0, 20)
+
+    f = io.StringIO()
+    bars.write_csv(f)
+    assert f.getvalue().splitlines()[0] == "tick,open,high,low,close,volume,vwap"
+
+def test_bars_of_ex():
+    random.seed(2)
+    ex = Ex(deal_log=NullDealLog(), link_log=False)
+    builder = BarBuilder()
+    builder.attach(ex)
+    fills = []
+    ex.subscribe_fills(lambda *fill: fills.append(fill))
+
+    for i in range(1, 4):
+        p = Puppet(f"player_{i}", 1_000_000_000, 1_000_000)
+        p.assign_decisions(deque(
+            ex.new_offer(p.player_id, random.choice((Direction.BUY, Direction.SELL)),
+                         random.randint(1, 20), round(random.gauss(100, 2), 1))
+            for _ in range(1_000)
+        ))
+        ex.add_player(p)
+    for _ in range(1_000):
+        ex.tick()
+        ex.deal()
+    builder.flush()
+
+    for resolution in (1, 10, 100, 1000):
+        bars = builder.bars(resolution)
+        assert sum(bars.columns["volume"]) == sum(n_stock for _, _, n_stock, _ in fills)
+        for i in range(len(bars)):
+            start, open_price, high, low, close, volume, vwap = bars[i]
+            prices = [price for tick, _, _, price in fills if start <= tick < start + resolution]
+            assert (open_price, high, low, close) == (prices[0], max(prices), min(prices), prices[-1])
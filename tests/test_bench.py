@@ -0,0 +1,12 @@
+from benchmarks.bench_exchange import measure, tick_random_walkers, book_depth
+
+
+def test_bench_smoke():
+    result = measure("tick_random_walkers", {"n_player": 5, "n_tick": 20}, tick_random_walkers)
+    assert result["ticks_per_sec"] > 0
+    assert result["n_offer"] > 0
+    assert result["peak_memory_bytes"] > 0
+
+    result = measure("book_depth", {"n_level": 10, "cancel_ratio": 0.5, "n_flow": 200}, book_depth)
+    assert result["n_offer"] > 0
+    assert result["n_fill"] > 0
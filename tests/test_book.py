@@ -0,0 +1,140 @@
+from book import Book, GridBook
+from exchange import Ex
+from player import Puppet
+from offer import Direction, Offer
+
+import random
+from collections import deque
+
+
+def test_grid_book_best():
+    book = GridBook(90, 110)
+
+    for price in (100.3, 99.8, 101.2, 100.0):
+        book.add(Offer("player_1", Direction.BUY, 10, price))
+        book.add(Offer("player_1", Direction.SELL, 10, price + 5))
+
+    assert book.best(Direction.BUY)[0] == 101.2
+    assert book.best(Direction.SELL)[0] == 104.8
+    assert book.n_levels() == 8
+
+    # Remove the best level. The next one is found by scanning the grid.
+    _, offers = book.best(Direction.BUY)
+    for offer in list(offers.values()):
+        book.remove(offer)
+    assert book.best(Direction.BUY)[0] == 100.3
+    assert book.n_levels() == 7
+
+    prices = [price for price, _ in book.levels(Direction.BUY)]
+    assert prices == [100.3, 100.0, 99.8]
+
+    book.clear()
+    assert book.best(Direction.BUY) == (-2, None)
+    assert book.best(Direction.SELL) == (-2, None)
+
+def test_grid_book_outside():
+    book = GridBook(90, 110)
+
+    book.add(Offer("player_1", Direction.BUY, 10, 100.0))
+    book.add(Offer("player_1", Direction.BUY, 10, 120.0))
+    book.add(Offer("player_1", Direction.BUY, 10, 100.05))
+    book.add(Offer("player_1", Direction.BUY, 10, 80.0))
+    assert book.best(Direction.BUY)[0] == 120.0
+
+    prices = [price for price, _ in book.levels(Direction.BUY)]
+    assert prices == [120.0, 100.05, 100.0, 80.0]
+
+    book.add(Offer("player_1", Direction.SELL, 10, 85.0))
+    book.add(Offer("player_1", Direction.SELL, 10, 95.0))
+    assert book.best(Direction.SELL)[0] == 85.0
+
+def run_random_offers(book, seed):
+    random.seed(seed)
+    ex = Ex(book=book)
+
+    for i in range(1,3):
+        p = Puppet(f"player_{i}", 1_000_000, 2_000)
+        p.assign_decisions(deque())
+        ex.add_player(p)
+
+    deals = []
+    for _ in range(500):
+        for player in ex.players.values():
+            price = round(random.gauss(100, 8), 1)
+            n_stock = int(random.gauss(20, 6))
+            direction = random.choice([Direction.BUY, Direction.SELL])
+            player.decisions.append(Offer(player.player_id, direction, n_stock, price))
+            if player.outstanding_offer and random.random() < 0.3:
+                # Sort first. The set order depends on the random offer_id.
+                offers = sorted(player.outstanding_offer, key=lambda o: (o.price, o.direction.value, o.n_stock))
+                player.decisions.append(random.choice(offers))
+        ex.tick()
+        ex.deal()
+        deals.append((ex.final_price, ex.all_players_n_stock(), ex.players["player_1"].n_stock))
+
+    return deals
+
+def test_grid_book_same_deals_as_book():
+    assert run_random_offers(Book(), 1) == run_random_offers(GridBook(85, 115), 1)
+
+def test_depth():
+    book = Book()
+    assert book.best_bid() is None
+    assert book.spread() is None
+
+    for price, n_stock in ((99.5, 10), (99.5, 5), (99.0, 7), (98.0, 1)):
+        book.add(Offer("player_1", Direction.BUY, n_stock, price))
+    sell = Offer("player_1", Direction.SELL, 20, 100.1)
+    book.add(sell)
+
+    assert book.best_bid() == 99.5
+    assert book.best_ask() == 100.1
+    assert book.spread() == 0.6
+    assert book.depth(Direction.BUY, 2) == [(99.5, 15, 2), (99.0, 7, 1)]
+
+    book.filled(sell, 8)
+    sell.n_stock -= 8
+    assert book.depth(Direction.SELL) == [(100.1, 12, 1)]
+    book.remove(sell)
+    assert book.depth(Direction.SELL) == []
+
+def test_depth_random_offers():
+    # The kept n_stock of each level is the sum of its offers, after deals and cancels
+    for book in (Book(), GridBook(95, 105)):
+        random.seed(5)
+        ex = Ex(book=book, link_log=False)
+        for i in range(1, 3):
+            p = Puppet(f"player_{i}", 1_000_000_000, 1_000_000)
+            p.assign_decisions(deque())
+            ex.add_player(p)
+
+        for _ in range(200):
+            offers = []
+            for player in ex.players.values():
+                for offer in list(player.outstanding_offer):
+                    if random.random() < 0.2:
+                        player.outstanding_offer.remove(offer)
+                        offers.append(offer)
+                offer = ex.new_offer(player.player_id, random.choice((Direction.BUY, Direction.SELL)),
+                                     random.randint(1, 20), round(random.gauss(100, 3), 1))
+                player.outstanding_offer.add(offer)
+                offers.append(offer)
+            ex.add_offers(offers)
+            ex.deal()
+
+            for direction in (Direction.BUY, Direction.SELL):
+                assert ex.depth(direction) == [
+                    (price, sum(offer.n_stock for offer in offers.values()), len(offers))
+                    for price, offers in book.levels(direction)
+                ]
+
+def test_levels_beyond():
+    for book in (Book(), GridBook(95, 105)):
+        for price in (99.0, 96.0, 94.9, 90.0, 97.5):
+            book.add(Offer("player_1", Direction.BUY, 10, price))
+        for price in (101.0, 105.0, 105.1, 110.0):
+            book.add(Offer("player_1", Direction.SELL, 10, price))
+
+        assert sorted(price for price, _ in book.levels_beyond(Direction.BUY, 96.0)) == [90.0, 94.9]
+        assert sorted(price for price, _ in book.levels_beyond(Direction.SELL, 105.0)) == [105.1, 110.0]
+        assert book.levels_beyond(Direction.BUY, 80.0) == []
@@ -0,0 +1,73 @@
+from exchange import Ex
+from player import RandomWalker
+from cohort import RandomWalkerCohort
+from offer import Direction
+
+import numpy as np
+
+
+def test_cohort_decide():
+    ex = Ex()
+    cohort = RandomWalkerCohort("cohort", 10_000, 1_000_000.0, 1_000, seed=1)
+    ex.add_player(cohort)
+
+    offers = cohort.decide()
+    assert len(offers) == 10_000
+    assert [offer.offer_id for offer in offers[:3]] == [0, 1, 2]
+
+    prices = np.array([offer.price for offer in offers])
+    n_stocks = np.array([offer.n_stock for offer in offers])
+    n_buy = sum(offer.direction == Direction.BUY for offer in offers)
+
+    # Same distribution as RandomWalker.decide
+    assert abs(prices.mean() - 100.5) < 0.1
+    assert abs(prices.std() - 2) < 0.1
+    # int() truncates, so the mean is about 19.5
+    assert abs(n_stocks.mean() - 19.5) < 0.3
+    assert abs(n_buy / 10_000 - 0.5) < 0.03
+
+    # The old offers are cancelled in the next decide
+    ex.add_offers(offers)
+    offers = cohort.decide()
+    assert len(offers) == 20_000
+    ex.add_offers(offers)
+    # Less the few offers of no stock, which are not taken
+    assert len(ex.offers) == sum(offer.n_stock > 0 for offer in cohort.offers)
+    assert len(ex.offers) > 9_900
+
+def test_cohort_drift():
+    ex = Ex()
+    cohort = RandomWalkerCohort("cohort", 10_000, 1_000_000.0, 1_000, seed=1)
+    ex.add_player(cohort)
+
+    ex.final_price = 130
+    prices = np.array([offer.price for offer in cohort.decide()])
+    assert abs(prices.mean() - 129.5) < 0.1
+
+    # Keep the direction until the price is out of the other side
+    ex.final_price = 100
+    prices = np.array([offer.price for offer in cohort.decide()[10_000:]])
+    assert abs(prices.mean() - 99.5) < 0.1
+
+def test_cohort_deals():
+    ex = Ex()
+    ex.add_player(RandomWalker("rand_1", 1_000_000.0, 1_000))
+    cohort = RandomWalkerCohort("cohort", 1_000, 1_000_000.0, 1_000, seed=1)
+    ex.add_player(cohort)
+
+    all_n_stock = ex.all_players_n_stock()
+    all_money = ex.all_players_money()
+    assert all_n_stock == 1_001_000
+    assert all_money == 1_001_000_000.0
+
+    for _ in range(20):
+        ex.tick()
+        ex.deal()
+
+    assert all_n_stock == ex.all_players_n_stock()
+    assert all_money == ex.all_players_money()
+
+    # Members have moved
+    assert (cohort.n_stocks != 1_000).any()
+    assert cohort.account(cohort.offers[3]).player_id == "cohort_3"
+    assert cohort.account(cohort.offers[3]).handle == cohort.handle + 3
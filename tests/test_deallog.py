@@ -0,0 +1,163 @@
+from exchange import Ex
+from player import Puppet
+from offer import Direction, Offer
+from deallog import BinaryDealLog, TextDealLog, NullDealLog, ThreadedDealLog, is_binary, read_deals, read_players, read_lines
+from journal import Journal
+
+import os
+import pytest
+import random
+import time
+from collections import deque
+
+
+def run_deals(deal_log, seed):
+    random.seed(seed)
+    ex = Ex(deal_log=deal_log)
+
+    for i in range(1,4):
+        p = Puppet(f"player_{i}", 1_000_000.0, 2_000)
+        p.assign_decisions(deque())
+        ex.add_player(p)
+
+    for _ in range(200):
+        for player in ex.players.values():
+            price = round(random.gauss(100, 2), 1)
+            n_stock = int(random.gauss(20, 6))
+            direction = random.choice([Direction.BUY, Direction.SELL])
+            player.decisions.append(Offer(player.player_id, direction, n_stock, price))
+        ex.tick()
+        ex.deal()
+
+    ex.deal_log.close()
+
+def test_binary_deal_log(tmp_path):
+    text_log_name = tmp_path / "deal.txt"
+    binary_log_name = tmp_path / "deal.bin"
+
+    # Small buffer to flush many times
+    run_deals(TextDealLog(text_log_name), 1)
+    run_deals(BinaryDealLog(binary_log_name, buffer_records=7), 1)
+
+    assert not is_binary(text_log_name)
+    assert is_binary(binary_log_name)
+
+    with open(text_log_name) as f:
+        text_lines = f.readlines()
+    assert len(text_lines) > 100
+
+    assert list(read_lines(binary_log_name)) == text_lines
+    assert list(read_lines(text_log_name)) == text_lines
+
+    assert set(read_players(binary_log_name).values()) == {"player_1", "player_2", "player_3"}
+
+    ticks = [deal[0] for deal in read_deals(binary_log_name)]
+    assert ticks == sorted(ticks)
+    assert 0 < ticks[0] <= ticks[-1] <= 200
+
+def test_threaded_deal_log(tmp_path):
+    text_log_name = tmp_path / "deal.txt"
+    threaded_log_name = tmp_path / "deal_threaded.txt"
+
+    run_deals(TextDealLog(text_log_name), 1)
+    deal_log = ThreadedDealLog(TextDealLog(threaded_log_name), max_queue=16, batch_size=5)
+    run_deals(deal_log, 1)
+
+    # Same lines, though the players changed after each deal was queued
+    with open(text_log_name) as f:
+        text_lines = f.readlines()
+    with open(threaded_log_name) as f:
+        assert f.readlines() == text_lines
+
+    metrics = deal_log.metrics()
+    assert metrics["written"] == len(text_lines)
+    assert metrics["bytes"] == os.path.getsize(threaded_log_name)
+    assert metrics["dropped"] == 0
+    assert metrics["queue_depth"] == 0
+    assert metrics["max_queue_depth"] <= 16
+
+class SlowDealLog(NullDealLog):
+    def __init__(self):
+        self.n_deal = 0
+
+    def write(self, tick, buyer, seller, n_stock, price):
+        time.sleep(0.001)
+        self.n_deal += 1
+        return 0
+
+def test_threaded_deal_log_drop():
+    inner = SlowDealLog()
+    deal_log = ThreadedDealLog(inner, max_queue=4, block=False)
+    player = Puppet("player_1", 1_000_000.0, 2_000)
+    for tick in range(100):
+        deal_log.write(tick, player, player, 1, 100.0)
+
+    deal_log.flush()
+    assert inner.n_deal == deal_log.n_written
+    deal_log.close()
+
+    metrics = deal_log.metrics()
+    assert metrics["dropped"] > 0
+    assert metrics["written"] + metrics["dropped"] == 100
+
+class FullDiskDealLog(NullDealLog):
+    def __init__(self, n_ok):
+        self.n_ok = n_ok
+
+    def write(self, tick, buyer, seller, n_stock, price):
+        if self.n_ok == 0:
+            raise OSError("No space left on device")
+        self.n_ok -= 1
+        return 10
+
+def test_threaded_deal_log_error():
+    deal_log = ThreadedDealLog(FullDiskDealLog(3), max_queue=4)
+    player = Puppet("player_1", 1_000_000.0, 2_000)
+    for tick in range(5):
+        deal_log.write(tick, player, player, 1, 100.0)
+
+    # The thread is not stuck. The error comes out.
+    with pytest.raises(OSError):
+        deal_log.flush()
+    with pytest.raises(OSError):
+        deal_log.write(5, player, player, 1, 100.0)
+    with pytest.raises(OSError):
+        deal_log.close()
+    assert deal_log.metrics()["written"] == 3
+    assert deal_log.metrics()["bytes"] == 30
+
+def test_threaded_deal_log_bytes():
+    deal_log = ThreadedDealLog(FullDiskDealLog(100))
+    player = Puppet("player_1", 1_000_000.0, 2_000)
+    n_bytes = 0
+    for tick in range(50):
+        n_bytes += deal_log.write(tick, player, player, 1, 100.0)
+        if tick % 10 == 0:
+            deal_log.flush()
+    deal_log.flush()
+    n_bytes += deal_log.write(50, player, player, 1, 100.0)
+    deal_log.close()
+
+    # The returns add up to the bytes written, as for the other deal logs
+    assert 0 < n_bytes == 500
+
+def test_close_null_deal_log():
+    ex = Ex(deal_log=NullDealLog(), link_log=True)
+    ex.close()
+    assert ex.closed
+
+def test_close_error(tmp_path):
+    journal = Journal(str(tmp_path / "flow.jnl"))
+    ex = Ex(deal_log=ThreadedDealLog(FullDiskDealLog(0)), link_log=False, journal=journal)
+    other = BinaryDealLog(str(tmp_path / "aaa.log"))
+    ex.add_symbol("AAA", deal_log=other)
+    player = Puppet("player_1", 1_000_000.0, 2_000)
+    ex.deal_log.write(1, player, player, 1, 100.0)
+
+    # The error of the writer thread comes out, after the other files are closed
+    with pytest.raises(OSError):
+        ex.close()
+    assert other.output_file.closed
+    assert journal.output_file.closed
+    # Closed once only
+    ex.close()
@@ -1,9 +1,11 @@
-from exchange import Ex
-from player import Puppet
+from exchange import Ex, clearing_price, crossing_levels
+from player import Puppet, RandomWalker, ValueInvestor
 from offer import Direction, Offer
+from deallog import NullDealLog
 
 import random
 from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 
 def test_exchange_basic():
@@ -59,17 +61,18 @@ def test_tick():
     ex.tick()
     ex.print_offers()
 
-    assert len(ex.offers) == 10
+    # The offers of player_0 have no stock. They are not taken.
+    assert len(ex.offers) == 9
 
     ex.tick()
     ex.print_offers()
 
-    assert len(ex.offers) == 20
+    assert len(ex.offers) == 18
 
     ex.tick()
     ex.print_offers()
 
-    assert len(ex.offers) == 20
+    assert len(ex.offers) == 18
 
 def get_standard_ex():
     ex = Ex()
@@ -482,3 +485,385 @@ def test_invariant():
 
     assert deal_done_count > 0
 
+
+def test_best_offers_price_index():
+    ex = get_standard_ex()
+
+    for price in (100.3, 99.8, 101.2, 100.0):
+        ex.players["player_1"].decisions.append(
+            Offer("player_1", Direction.BUY, 10, price)
+        )
+        ex.players["player_2"].decisions.append(
+            Offer("player_2", Direction.SELL, 10, price + 5)
+        )
+        ex.tick()
+
+    best_buy_price, _ = ex.best_offers(Direction.BUY)
+    best_sell_price, _ = ex.best_offers(Direction.SELL)
+    assert best_buy_price == 101.2
+    assert best_sell_price == 104.8
+
+    # Empty levels drop out of the index
+    ex.players["player_1"].decisions += [
+        o for o in ex.players["player_1"].outstanding_offer if o.price == 101.2
+    ]
+    ex.tick()
+    best_buy_price, _ = ex.best_offers(Direction.BUY)
+    assert best_buy_price == 100.3
+    assert 101.2 not in ex.book.price2offer[Direction.BUY]
+    assert len(ex.book.price_index[Direction.BUY]) == 3
+
+    ex.del_all_offers()
+    assert ex.best_offers(Direction.BUY) == (-2, None)
+    assert ex.best_offers(Direction.SELL) == (-2, None)
+
+def test_cancel_unlinks_offer():
+    ex = get_standard_ex()
+
+    for i in range(5):
+        ex.players["player_1"].decisions.append(
+            Offer("player_1", Direction.BUY, 10, 90.0 + i % 2)
+        )
+    for _ in range(5):
+        ex.tick()
+
+    assert ex.book_size() == {"levels": 2, "live": 5, "dead": 0}
+
+    # Cancel the offers deep in the queues, not at the best price.
+    ex.players["player_1"].decisions += [
+        o for o in ex.players["player_1"].outstanding_offer if o.price == 90.0
+    ]
+    for _ in range(3):
+        ex.tick()
+
+    assert ex.book_size() == {"levels": 1, "live": 2, "dead": 0}
+    assert 90.0 not in ex.book.price2offer[Direction.BUY]
+    assert ex.best_offers(Direction.BUY)[0] == 91.0
+
+def test_running_totals():
+    ex = Ex(check_invariants=True)
+    p = Puppet("player_1", 1_000_000.25, 2_000)
+    p.assign_decisions(deque())
+    ex.add_player(p)
+    ex.add_player(RandomWalker("rand_1", 0, 0))
+    ex.add_player(RandomWalker("rand_2", 500.5, 10))
+
+    assert ex.all_players_money() == 1_000_500.75
+    assert ex.all_players_n_stock() == 2_010
+    assert ex.all_strategies_totals() == {
+        "Puppet": (1_000_000.25, 2_000),
+        "RandomWalker": (500.5, 10),
+    }
+
+    for _ in range(200):
+        ex.tick()
+        ex.deal()
+
+    assert ex.all_players_money() == 1_000_500.75
+    assert ex.all_players_n_stock() == 2_010
+    assert ex.all_players_n_stock() == ex.recount_totals()[1]
+    assert round(ex.all_players_money(), 2) == round(ex.recount_totals()[0], 2)
+
+    money, n_stock = ex.all_strategies_totals()["RandomWalker"]
+    assert n_stock == ex.players["rand_1"].n_stock + ex.players["rand_2"].n_stock
+
+def test_invariant_check():
+    ex = get_standard_ex()
+    ex.check_invariants = True
+
+    # A player who doesn't pay for the stock
+    player_1 = ex.players["player_1"]
+    deal_done = player_1.deal_done
+    def leaky_deal_done(offer, direction, n_stock, price):
+        ok = deal_done(offer, direction, n_stock, price)
+        ex.update_totals(player_1, 100, 0)
+        return ok
+    player_1.deal_done = leaky_deal_done
+
+    player_1.decisions.append(Offer("player_1", Direction.BUY, 10, 100.0))
+    ex.players["player_2"].decisions.append(Offer("player_2", Direction.SELL, 10, 100.0))
+    ex.tick()
+
+    try:
+        ex.deal()
+    except AssertionError as e:
+        assert "Money leak" in str(e)
+    else:
+        assert False, "The leak is not found"
+
+def new_symbols_ex():
+    ex = Ex(deal_log=NullDealLog(), link_log=False)
+    ex.add_symbol("AAA", deal_log=NullDealLog(), price=50)
+    for i in (1, 2):
+        p = Puppet(f"player_{i}", 1_000_000, 2_000)
+        p.assign_decisions(deque())
+        ex.add_player(p)
+    return ex
+
+def symbol_offers(ex):
+    p1 = ex.players["player_1"]
+    p2 = ex.players["player_2"]
+    offers = [
+        ex.new_offer("player_1", Direction.BUY, 10, 101.0),
+        ex.new_offer("player_2", Direction.SELL, 5, 100.0),
+        ex.new_offer("player_1", Direction.BUY, 7, 51.0, "AAA"),
+        ex.new_offer("player_2", Direction.SELL, 3, 50.0, "AAA"),
+        ex.new_offer("player_2", Direction.SELL, 3, 50.5, "AAA"),
+    ]
+    for offer in offers:
+        player = p1 if offer.player_id == "player_1" else p2
+        player.outstanding_offer.add(offer)
+    return offers
+
+def test_symbols():
+    ex = new_symbols_ex()
+    ex.add_offers(symbol_offers(ex))
+
+    # Books of symbols are apart
+    assert ex.book.n_levels() == 2
+    assert ex.books["AAA"].n_levels() == 3
+
+    assert ex.deal()
+
+    assert ex.final_price == 100.5
+    assert ex.final_prices["AAA"] == 50.8
+    p1 = ex.players["player_1"]
+    assert p1.n_stock == 2_000 + 5
+    assert p1.positions["AAA"] == 6
+    assert ex.all_players_n_stock() == 4_000
+    assert ex.recount_totals()[1] == 4_000
+    assert ex.book_size() == {"levels": 2, "live": 2, "dead": 0}
+
+def test_deal_parallel():
+    ex = new_symbols_ex()
+    ex.add_offers(symbol_offers(ex))
+    ex.deal()
+
+    ex_parallel = new_symbols_ex()
+    ex_parallel.add_offers(symbol_offers(ex_parallel))
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert ex_parallel.deal_parallel(executor)
+        assert not ex_parallel.deal_parallel(executor)
+
+    assert ex_parallel.final_prices == ex.final_prices
+    assert ex_parallel.book_size() == ex.book_size()
+    for player_id, player in ex.players.items():
+        assert ex_parallel.players[player_id].positions == player.positions
+        assert ex_parallel.players[player_id].money == player.money
+
+def test_deal_parallel_levels():
+    ex = new_symbols_ex()
+    offers = symbol_offers(ex)
+    # Resting offers away from the cross are not sent, nor filled
+    for i in range(20):
+        offers.append(ex.new_offer("player_1", Direction.BUY, 1, 90.0 - i))
+        offers.append(ex.new_offer("player_2", Direction.SELL, 1, 110.0 + i))
+    for offer in offers[5:]:
+        ex.players[offer.player_id].outstanding_offer.add(offer)
+    ex.add_offers(offers)
+
+    buy_levels, sell_levels = crossing_levels(ex.book)
+    assert [price for price, _ in buy_levels] == [101.0]
+    assert [price for price, _ in sell_levels] == [100.0]
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert ex.deal_parallel(executor)
+    assert ex.final_price == 100.5
+    assert ex.book.n_levels() == 41
+
+def test_deal_parallel_auction():
+    ex = new_symbols_ex()
+    ex.auction = True
+    ex.add_offers(symbol_offers(ex))
+    ex.deal()
+
+    ex_parallel = new_symbols_ex()
+    ex_parallel.auction = True
+    ex_parallel.add_offers(symbol_offers(ex_parallel))
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert ex_parallel.deal_parallel(executor)
+
+    assert ex_parallel.final_prices == ex.final_prices
+    for player_id, player in ex.players.items():
+        assert ex_parallel.players[player_id].positions == player.positions
+
+class RecordDealLog(NullDealLog):
+    def __init__(self):
+        self.deals = []
+
+    def write(self, tick, buyer, seller, n_stock, price):
+        self.deals.append((tick, buyer.player_id, seller.player_id, n_stock, price))
+        return 0
+
+class PositionDealLog(NullDealLog):
+    def __init__(self):
+        self.deals = []
+
+    def write(self, tick, buyer, seller, n_stock, price):
+        self.deals.append((buyer.n_stock, seller.n_stock))
+        return 0
+
+def test_symbol_deal_log():
+    ex = new_symbols_ex()
+    ex.deal_logs["AAA"] = PositionDealLog()
+    ex.add_offers(symbol_offers(ex))
+    ex.deal()
+
+    # The positions of AAA, not the ones of STOCK
+    assert ex.deal_logs["AAA"].deals == [(3, -3), (6, -6)]
+
+def test_continuous():
+    random.seed(3)
+    flow = [
+        (f"player_{random.randrange(3)}",
+         random.choice((Direction.BUY, Direction.SELL)),
+         random.randint(1, 40),
+         round(random.gauss(100, 1), 1))
+        for _ in range(2_000)
+    ]
+
+    def run(continuous):
+        ex = Ex(deal_log=RecordDealLog(), link_log=False, continuous=continuous)
+        for i in range(3):
+            p = Puppet(f"player_{i}", 1_000_000_000, 1_000_000)
+            p.assign_decisions(deque())
+            ex.add_player(p)
+
+        for player_id, direction, n_stock, price in flow:
+            offer = ex.new_offer(player_id, direction, n_stock, price)
+            ex.players[player_id].outstanding_offer.add(offer)
+            ex.add_offers([offer])
+            if continuous:
+                # Never crossed, nothing left to deal
+                assert not ex.deal()
+            else:
+                ex.deal()
+        return ex
+
+    batch = run(False)
+    continuous = run(True)
+
+    assert len(batch.deal_log.deals) > 100
+    assert continuous.deal_log.deals == batch.deal_log.deals
+    assert continuous.book_size() == batch.book_size()
+    for player_id, player in batch.players.items():
+        assert continuous.players[player_id].money == player.money
+        assert continuous.players[player_id].n_stock == player.n_stock
+
+def test_continuous_players():
+    # Players cancel their old offers along with a new one,
+    # which may fill them first
+    random.seed(3)
+    ex = Ex(deal_log=NullDealLog(), link_log=False, continuous=True)
+    for i in range(20):
+        ex.add_player(RandomWalker(f"rand_{i}", 0, 0))
+    ex.add_player(ValueInvestor("val_1", 1_000_000_000, 2_000))
+
+    for _ in range(500):
+        ex.tick()
+        assert all(offer.n_stock > 0 for offer in ex.offers.values())
+        bid = ex.best_bid()
+        ask = ex.best_ask()
+        assert bid is None or ask is None or bid < ask
+    assert ex.book_size()["live"] == len(ex.offers)
+
+def test_clearing_price():
+    buy_levels = [(101, 10), (100, 10), (99, 10)]
+    sell_levels = [(98, 5), (99, 10), (100, 10)]
+    assert clearing_price(buy_levels, sell_levels, 100) == (100, 20)
+
+    # Not crossed
+    assert clearing_price([(99, 10)], [(100, 10)], 100)[1] == 0
+
+    # Same volume and imbalance at 99 and 100. Nearer the reference wins.
+    assert clearing_price([(100, 10)], [(99, 10)], 95) == (99, 10)
+    assert clearing_price([(100, 10)], [(99, 10)], 105) == (100, 10)
+
+def test_uncross():
+    ex = Ex(deal_log=RecordDealLog(), link_log=False, auction=True)
+    for i in (1, 2):
+        p = Puppet(f"player_{i}", 1_000_000, 2_000)
+        p.assign_decisions(deque())
+        ex.add_player(p)
+    p1 = ex.players["player_1"]
+    p2 = ex.players["player_2"]
+
+    offers = []
+    for player, direction, n_stock, price in (
+        (p1, Direction.BUY, 10, 101.0),
+        (p1, Direction.BUY, 10, 100.0),
+        (p1, Direction.BUY, 10, 99.0),
+        (p2, Direction.SELL, 5, 98.0),
+        (p2, Direction.SELL, 10, 99.0),
+        (p2, Direction.SELL, 10, 100.0),
+    ):
+        offer = ex.new_offer(player.player_id, direction, n_stock, price)
+        player.outstanding_offer.add(offer)
+        offers.append(offer)
+    ex.add_offers(offers)
+
+    assert ex.deal()
+    assert not ex.deal()
+
+    # Everything at the one price
+    assert ex.final_price == 100.0
+    assert {deal[4] for deal in ex.deal_log.deals} == {100.0}
+    assert sum(deal[3] for deal in ex.deal_log.deals) == 20
+    assert p1.n_stock == 2_000 + 20
+    assert p1.money == 1_000_000 - 20 * 100
+
+    # Left: buy 10 @ 99, sell 5 @ 100
+    assert ex.best_offers(Direction.BUY)[0] == 99.0
+    _, sell_offers = ex.best_offers(Direction.SELL)
+    assert [offer.n_stock for offer in sell_offers.values()] == [5]
+
+def test_expiry():
+    ex = Ex(deal_log=NullDealLog(), link_log=False)
+    p = Puppet("player_1", 1_000_000, 2_000)
+    p.assign_decisions(deque())
+    ex.add_player(p)
+
+    ex.tick()
+    short = ex.new_offer("player_1", Direction.BUY, 10, 99.0, ttl=1)
+    long = ex.new_offer("player_1", Direction.BUY, 10, 98.0, ttl=3)
+    forever = ex.new_offer("player_1", Direction.SELL, 10, 101.0)
+    p.outstanding_offer.update((short, long, forever))
+    ex.add_offers([short, long, forever])
+
+    ex.tick()
+    assert short.offer_id not in ex.offers
+    assert short not in p.outstanding_offer
+    assert ex.best_bid() == 98.0
+
+    ex.tick()
+    ex.tick()
+    assert ex.best_bid() is None
+    assert p.outstanding_offer == {forever}
+    assert ex.expiry == {}
+
+def test_price_band():
+    ex = Ex(deal_log=NullDealLog(), link_log=False, price_band=5)
+    p = Puppet("player_1", 1_000_000, 2_000)
+    p.assign_decisions(deque())
+    ex.add_player(p)
+
+    offers = [
+        ex.new_offer("player_1", Direction.BUY, 10, price)
+        for price in (99.0, 96.0, 94.9, 90.0)
+    ] + [
+        ex.new_offer("player_1", Direction.SELL, 10, price)
+        for price in (101.0, 105.0, 105.1)
+    ]
+    p.outstanding_offer.update(offers)
+    ex.add_offers(offers)
+
+    ex.tick()
+    assert [price for price, _, _ in ex.depth(Direction.BUY)] == [99.0, 96.0]
+    assert [price for price, _, _ in ex.depth(Direction.SELL)] == [101.0, 105.0]
+    assert len(p.outstanding_offer) == len(ex.offers) == 4
+
+    # The band follows the final price
+    ex.final_price = 102
+    ex.tick()
+    assert [price for price, _, _ in ex.depth(Direction.BUY)] == [99.0]
+    assert len(p.outstanding_offer) == len(ex.offers) == 3
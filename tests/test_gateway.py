@@ -0,0 +1,156 @@
+from gateway import Client, Gateway, decode, frame, encode_login, encode_new, encode_price, FRAME, NEW
+from exchange import Ex
+from deallog import NullDealLog
+from offer import Direction
+import asyncio
+import pytest
+
+def test_encode_decode():
+    message = encode_new(7, Direction.SELL, 12, 99.5, "AAA")
+    assert FRAME.unpack_from(message)[0] == len(message) - FRAME.size
+    assert decode(message[FRAME.size:]) == ("N", (7, Direction.SELL, 12, 99.5, "AAA"))
+
+    message = encode_price(3, 101.2, "STOCK")
+    assert decode(message[FRAME.size:]) == ("P", (3, 101.2, "STOCK"))
+
+def test_decode_malformed():
+    for payload in (b"", b"N", b"N\x01", b"Z" + bytes(30), frame(b"N", NEW.pack(1, 5, 10, 100.0))[FRAME.size:]):
+        with pytest.raises(ValueError):
+            decode(payload)
+
+async def wait_pending(gateway, n):
+    # Until the gateway has read n messages for the next tick
+    while len(gateway.pending) < n:
+        await asyncio.sleep(0.01)
+
+async def trade(path):
+    ex = Ex(deal_log=NullDealLog(), link_log=False)
+    gateway = Gateway(ex, tick_interval=0)
+    await gateway.serve_unix(path)
+
+    buyer = await Client.connect("buyer", 10_000, 0, path=path)
+    seller = await Client.connect("seller", 0, 100, path=path)
+
+    buyer.new(1, Direction.BUY, 10, 101.0)
+    buyer.new(2, Direction.BUY, 10, 90.0)
+    await buyer.flush()
+    seller.new(1, Direction.SELL, 4, 100.0)
+    await seller.flush()
+    await wait_pending(gateway, 3)
+
+    # All in one tick
+    await gateway.run(1)
+    assert ex.n_tick == 1
+
+    # Fill, then the price
+    assert await buyer.receive() == ("F", (1, 1, 4, 100.5))
+    assert await buyer.receive() == ("P", (1, 100.5, "STOCK"))
+    assert await seller.receive() == ("F", (1, 1, 4, 100.5))
+
+    # Amend the 90 bid up to cross, cancel the rest of the first
+    buyer.amend(2, 5, 101.0)
+    buyer.cancel(1)
+    await buyer.flush()
+    seller.new(2, Direction.SELL, 20, 101.0)
+    await seller.flush()
+    await wait_pending(gateway, 3)
+    await gateway.run(1)
+
+    assert await buyer.receive() == ("F", (2, 2, 5, 101.0))
+    assert ex.players["buyer"].n_stock == 9
+    assert ex.players["seller"].n_stock == 91
+    # The rest of the sell is left
+    assert len(ex.offers) == 1
+
+    # Close the seller. Its offers are cancelled.
+    await seller.close()
+    await wait_pending(gateway, 1)
+    await gateway.run(1)
+    assert len(ex.offers) == 0
+
+    await buyer.close()
+    await gateway.close()
+
+def test_gateway(tmp_path):
+    asyncio.run(asyncio.wait_for(trade(str(tmp_path / "ex.sock")), 10))
+
+async def hostile(path):
+    ex = Ex(deal_log=NullDealLog(), link_log=False)
+    gateway = Gateway(ex, tick_interval=0)
+    await gateway.serve_unix(path)
+
+    seller = await Client.connect("seller", 0, 100, path=path)
+    seller.new(1, Direction.SELL, 10, 100.0)
+    await seller.flush()
+    await wait_pending(gateway, 1)
+    await gateway.run(1)
+
+    # Orders the ex can not take are ignored
+    buyer = await Client.connect("buyer", 10_000, 0, path=path)
+    buyer.new(1, Direction.BUY, -50, 101.0)
+    buyer.new(2, Direction.BUY, 0, 101.0)
+    buyer.new(3, Direction.BUY, 10, float("nan"))
+    buyer.new(4, Direction.BUY, 10, float("inf"))
+    buyer.new(5, Direction.BUY, 10, 101.0, "NO_SUCH_SYMBOL")
+    buyer.new(6, Direction.BUY, 10, 90.0)
+    buyer.amend(6, -10, 101.0)
+    await buyer.flush()
+    await wait_pending(gateway, 7)
+    await gateway.run(1)
+
+    player = ex.players["buyer"]
+    assert player.n_rejected == 6
+    assert player.n_stock == 0
+    assert player.money == 10_000
+    assert ex.players["seller"].n_stock == 100
+    assert [offer.n_stock for offer in ex.offers.values()] == [10, 10]
+    assert ex.best_bid() == 90.0
+
+    # A second login of a connected player is refused
+    twin = await Client.connect("buyer", 1_000_000, 1_000, path=path)
+    assert await twin.receive() is None
+    assert ex.players["buyer"] is player
+    assert ex.all_players_money() == 10_000
+
+    # A malformed frame closes the connection. Its offers are cancelled.
+    seller.writer.write(frame(b"N", NEW.pack(2, 5, 10, 100.0)))
+    await seller.flush()
+    assert await seller.receive() is None
+    await wait_pending(gateway, 1)
+    await gateway.run(1)
+    assert ex.best_ask() is None
+
+    # So does an empty frame, and a bad login
+    stranger = await Client.connect("stranger", 0, 0, path=path)
+    stranger.writer.write(b"\x00\x00")
+    await stranger.flush()
+    assert await stranger.receive() is None
+    stray = Client(*await asyncio.open_unix_connection(path))
+    stray.writer.write(frame(b"L", b"\x01"))
+    await stray.flush()
+    assert await stray.receive() is None
+
+    # The gateway still serves the others
+    buyer.new(7, Direction.BUY, 5, 95.0)
+    await buyer.flush()
+    await wait_pending(gateway, 2)
+    await gateway.run(1)
+    assert ex.best_bid() == 95.0
+
+    # A disconnected player may log in again, and keeps its account
+    seller_player = ex.players["seller"]
+    again = await Client.connect("seller", 0, 0, path=path)
+    again.new(3, Direction.SELL, 5, 95.0)
+    await again.flush()
+    await wait_pending(gateway, 1)
+    await gateway.run(1)
+    assert ex.players["seller"] is seller_player
+    assert seller_player.n_stock == 95
+    assert await again.receive() == ("F", (5, 3, 5, 95.0))
+
+    for client in (buyer, twin, seller, stranger, stray, again):
+        await client.close()
+    await gateway.close()
+
+def test_gateway_hostile(tmp_path):
+    asyncio.run(asyncio.wait_for(hostile(str(tmp_path / "ex.sock")), 10))
@@ -0,0 +1,52 @@
+from indicators import Indicators, RollingWindow
+from exchange import Ex
+from player import TrendFollower
+
+def test_rolling_window():
+    indicators = Indicators()
+    window = indicators.subscribe(3)
+
+    for price in (100, 101.1, 99.9, 102):
+        indicators.update(price)
+
+    assert window.full
+    assert list(window.values) == [101_100_000, 99_900_000, 102_000_000]
+    assert abs(window.sum - 303.0) < 1e-9
+    assert abs(window.mean - 101.0) < 1e-9
+    assert abs(window.stdev - (2.22 / 3) ** 0.5) < 1e-9
+
+def test_equal_means():
+    indicators = Indicators()
+    five = indicators.subscribe(5)
+    ten = indicators.subscribe(10)
+
+    for _ in range(20):
+        indicators.update(100.1)
+
+    # Exact. A float sum would drift apart.
+    assert five.mean == ten.mean
+
+def test_subscribe_shares_and_backfills():
+    indicators = Indicators()
+    ten = indicators.subscribe(10)
+    for price in range(1, 8):
+        indicators.update(price)
+
+    assert indicators.subscribe(10) is ten
+
+    three = indicators.subscribe(3)
+    assert three.full
+    assert three.mean == 6
+
+def test_trend_follower_waits_for_window():
+    ex = Ex(link_log=False)
+    player = TrendFollower("trend_player", 1_000_000.0, 1_000)
+    ex.add_player(player)
+
+    # Not due until the ten ticks window is full
+    for _ in range(9):
+        ex.tick()
+        assert player.ex.scheduler.always == []
+    ex.tick()
+    assert player.ten_ticks.full
+    assert player in ex.scheduler.always
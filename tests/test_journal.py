@@ -0,0 +1,46 @@
+from journal import Journal, replay, read_records, NEW, CANCEL, DEAL, FILL
+from run import simulate, add_players
+from exchange import Ex
+from deallog import NullDealLog
+
+def record(file_name, n_tick, **kwargs):
+    journal = Journal(file_name)
+    ex = Ex(deal_log=NullDealLog(), link_log=False, journal=journal, **kwargs)
+    add_players(ex, {"RandomWalker": 20, "ValueInvestor": 1, "TrendFollower": 1})
+    for _ in range(n_tick):
+        ex.tick()
+        ex.deal()
+    ex.close()
+    return ex
+
+def test_replay(tmp_path):
+    file_name = str(tmp_path / "flow.jnl")
+    ex = record(file_name, 300)
+
+    kinds = {kind for kind, *_ in read_records(file_name)}
+    assert kinds == {NEW, CANCEL, DEAL, FILL}
+
+    replayed, fills, journal_fills, _ = replay(file_name)
+    assert len(fills) > 0
+    assert fills == journal_fills
+    assert replayed.final_price == ex.final_price
+    assert sorted(replayed.offers) == sorted(ex.offers)
+    for player_id, player in ex.players.items():
+        assert replayed.players[player_id].positions == player.positions
+        assert replayed.players[player_id].money == player.money
+
+def test_replay_continuous(tmp_path):
+    file_name = str(tmp_path / "flow.jnl")
+    record(file_name, 200, continuous=True)
+
+    _, fills, journal_fills, _ = replay(file_name, Ex(deal_log=NullDealLog(), link_log=False, continuous=True))
+    assert len(fills) > 0
+    assert fills == journal_fills
+
+def test_simulate_journal(tmp_path):
+    file_name = str(tmp_path / "flow.jnl")
+    summary = simulate(1, 100, journal=Journal(file_name))
+
+    _, fills, journal_fills, _ = replay(file_name)
+    assert fills == journal_fills
+    assert fills[-1][3] == summary["price_last"]
@@ -0,0 +1,48 @@
+from exchange import Ex
+from ledger import Ledger
+from player import RandomWalker
+from deallog import NullDealLog
+from offer import HandleOffer
+
+import random
+
+def test_ledger():
+    random.seed(1)
+    ex = Ex(deal_log=NullDealLog(), link_log=False, check_invariants=True)
+    ex.add_player(RandomWalker("rand_1", 1_000_000, 1_000))
+    ledger = Ledger("ledger", 1_000, seed=1)
+    ex.add_player(ledger)
+    assert ledger.handle == 1
+    assert ex.next_handle == 1_001
+
+    assert ledger.add_agents(900, 10_000, 100, "Passive") == range(0, 900)
+    assert ledger.add_agents(100, 10_000, 100, "RandomWalker", active=0.2) == range(900, 1_000)
+
+    offers = ledger.decide()
+    assert 0 < len(offers) < 100
+    assert all(isinstance(offer, HandleOffer) for offer in offers)
+    # Only the active group
+    assert all(ledger.handle + 900 <= offer.handle < ledger.handle + 1_000 for offer in offers)
+    ex.add_offers(offers)
+
+    for _ in range(200):
+        ex.tick()
+        ex.deal()
+
+    # Passive agents never trade
+    assert (ledger.n_stocks[:900] == 100).all()
+    assert (ledger.money_cents[:900] == 1_000_000).all()
+    assert (ledger.n_stocks[900:] != 100).any()
+
+    totals = ex.all_strategies_totals()
+    ledger_totals = ledger.strategy_totals()
+    assert totals["Passive"] == ledger_totals["Passive"] == (9_000_000, 90_000)
+    assert totals["RandomWalker"][1] == ledger_totals["RandomWalker"][1] + ex.players["rand_1"].n_stock
+    money, n_stock = ex.recount_totals()
+    assert abs(money - ex.all_players_money()) < 1e-6
+    assert n_stock == ex.all_players_n_stock()
+
+    # An offer of the book belongs to its agent
+    for offer in ex.offers.values():
+        if offer.player_id == "ledger":
+            assert ledger.outstanding[offer.handle - ledger.handle] == offer.offer_id
@@ -1,4 +1,5 @@
 from offer import Direction, Offer
+from exchange import Ex
 import uuid
 
 def test_offer_repr():
@@ -24,3 +25,19 @@ def test_sell_offer_str():
     oracle = "Player:dummy_player Direction.SELL 17 @$243.40"
     assert offer_str[-len(oracle):] == oracle
 
+
+def test_compact_offer():
+    ex = Ex()
+
+    offers = [ex.new_offer("dummy_player", Direction.BUY, 10, 100.0) for _ in range(3)]
+    assert [offer.offer_id for offer in offers] == [0, 1, 2]
+
+    assert offers[0].side == 1
+    assert ex.new_offer("dummy_player", Direction.SELL, 10, 100.0).side == -1
+
+    oracle = "ID:0 Player:dummy_player Direction.BUY 10 @$100.00"
+    assert str(offers[0]) == oracle
+
+    # No __dict__ for each offer
+    assert not hasattr(offers[0], "__dict__")
+    assert not hasattr(Offer("dummy_player", Direction.BUY, 10, 100.0), "__dict__")
@@ -145,25 +145,30 @@ def test_trend_follower():
 
     player.assign_ex(ex)
 
+    # As in a tick: the ex updates the indicators, then the player decides
+    def decide():
+        ex.indicators.update(ex.final_price)
+        return player.decide()
+
     # No offers when not enough data
     for i in range(9):
-        offers = player.decide()
+        offers = decide()
         assert offers == [], f"{i=}"
         assert len(player.outstanding_offer) == 0, f"{i=}"
 
     # No offers when the trend is unclear
     # (the final price doesn't move)
     for i in range(10):
-        offers = player.decide()
+        offers = decide()
         assert offers == [], f"{i=}"
         assert len(player.outstanding_offer) == 0, f"{i=}"
 
     # Make the trend goes up
     ex.final_price = 150
-    offers = player.decide()
+    offers = decide()
 
     for i in range(3):
-        offers = player.decide()
+        offers = decide()
 
         assert len(offers) == 2, f"{i=}"
         assert len(player.outstanding_offer) == 1, f"{i=}"
@@ -173,19 +178,19 @@ def test_trend_follower():
 
     # Make the trend unclear again
     for i in range(10):
-        offers = player.decide()
+        offers = decide()
 
     for i in range(10):
-        offers = player.decide()
+        offers = decide()
         assert offers == [], f"{i=}"
         assert len(player.outstanding_offer) == 0, f"{i=}"
 
     # Make the trend goes down
     ex.final_price = 50
-    offers = player.decide()
+    offers = decide()
 
     for i in range(3):
-        offers = player.decide()
+        offers = decide()
 
         assert len(offers) == 2, f"{i=}"
         assert len(player.outstanding_offer) == 1, f"{i=}"
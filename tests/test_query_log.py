@@ -0,0 +1,58 @@
+from exchange import Ex
+from player import Puppet
+from offer import Direction, Offer
+from deallog import BinaryDealLog, read_deals, read_players
+from query_log import query, index_name
+
+import os
+import random
+from collections import deque
+
+
+def make_log(file_name):
+    random.seed(2)
+    ex = Ex(deal_log=BinaryDealLog(file_name, buffer_records=5))
+
+    for i in range(1,6):
+        p = Puppet(f"player_{i}", 1_000_000.0, 2_000)
+        p.assign_decisions(deque())
+        ex.add_player(p)
+
+    for _ in range(300):
+        for player in ex.players.values():
+            price = round(random.gauss(100, 2), 1)
+            n_stock = int(random.gauss(20, 6))
+            direction = random.choice([Direction.BUY, Direction.SELL])
+            player.decisions.append(Offer(player.player_id, direction, n_stock, price))
+        ex.tick()
+        ex.deal()
+
+    ex.deal_log.close()
+
+def scan(file_name, player_ids, tick_from, tick_to):
+    # The full scan to compare with
+    names = read_players(file_name)
+    for i, (tick, buyer, seller, n_stock, price, buyer_money, buyer_n_stock, seller_money, seller_n_stock) in enumerate(read_deals(file_name)):
+        if not tick_from <= tick <= tick_to:
+            continue
+        if names[buyer] in player_ids:
+            yield i, tick, names[buyer], 'B', buyer_money, buyer_n_stock, n_stock, price
+        if names[seller] in player_ids:
+            yield i, tick, names[seller], 'S', seller_money, seller_n_stock, n_stock, price
+
+def test_query(tmp_path):
+    file_name = tmp_path / "deal.bin"
+    make_log(file_name)
+
+    player_ids = ["player_2", "player_4"]
+    deals = list(query(file_name, player_ids, 50, 200))
+    assert len(deals) > 10
+    assert deals == list(scan(file_name, player_ids, 50, 200))
+
+    # The side index is saved and used again
+    assert os.path.exists(index_name(file_name))
+    assert list(query(file_name, player_ids, 50, 200)) == deals
+
+    assert list(query(file_name, ["player_1"])) == list(scan(file_name, ["player_1"], 0, 300))
+    assert list(query(file_name, ["player_1"], 1000, 2000)) == []
+    assert list(query(file_name, ["nobody"])) == []
@@ -0,0 +1,37 @@
+from run import simulate, monte_carlo
+
+import gc
+import os
+
+
+def test_simulate():
+    summary = simulate(1, 200)
+
+    assert summary["n_stock_ok"]
+    assert summary["money_ok"]
+    assert summary["price_min"] <= summary["price_mean"] <= summary["price_max"]
+
+    # Same seed, same run
+    assert simulate(1, 200) == summary
+
+def test_monte_carlo(tmp_path):
+    # Other Ex left by other tests link deal.log when collected
+    gc.collect()
+
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        results = list(monte_carlo(3, 100, seed=5, max_workers=2))
+    finally:
+        os.chdir(cwd)
+
+    # No deal log, no deal.log link from the workers
+    assert os.listdir(tmp_path) == []
+
+    summaries = [summary for summary, _ in results]
+    assert sorted(summary["seed"] for summary in summaries) == [5, 6, 7]
+
+    _, aggregate = results[-1]
+    assert aggregate["n_run"] == 3
+    assert aggregate["n_stock_ok"] == 3
+    assert len(aggregate["price_last"]) == 3
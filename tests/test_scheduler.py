@@ -0,0 +1,73 @@
+from scheduler import Scheduler
+from exchange import Ex
+from player import Puppet, ValueInvestor
+from offer import Direction, Offer
+
+from collections import deque
+
+
+def test_every():
+    scheduler = Scheduler()
+    scheduler.every("a", 1)
+    scheduler.every("b", 3)
+    scheduler.every("c", 2, start=4)
+
+    due = [sorted(scheduler.due(n_tick, 100)) for n_tick in range(1, 8)]
+    assert due == [
+        ["a", "b"],
+        ["a"],
+        ["a"],
+        ["a", "b", "c"],
+        ["a"],
+        ["a", "c"],
+        ["a", "b"],
+    ]
+
+def test_price_outside():
+    scheduler = Scheduler()
+    scheduler.price_outside("a", 80, 120)
+    scheduler.price_outside("b", 90, 110)
+
+    assert scheduler.due(1, 100) == []
+    assert sorted(scheduler.due(2, 85)) == ["b"]
+    assert sorted(scheduler.due(3, 70)) == ["a", "b"]
+    assert scheduler.due(4, 115) == ["b"]
+    assert sorted(scheduler.due(5, 130)) == ["a", "b"]
+    assert scheduler.due(6, 80) == ["b"]
+
+def test_on_fill():
+    scheduler = Scheduler()
+    scheduler.on_fill("a")
+
+    scheduler.filled("a")
+    scheduler.filled("b")
+    assert scheduler.due(1, 100) == ["a"]
+    assert scheduler.due(2, 100) == []
+
+class CountingValueInvestor(ValueInvestor):
+    def __init__(self, player_id, money, n_stock):
+        super().__init__(player_id, money, n_stock)
+        self.n_decide = 0
+
+    def decide(self):
+        self.n_decide += 1
+        return super().decide()
+
+def test_idle_player_not_called():
+    ex = Ex()
+    p = Puppet("player_1", 1_000_000, 2_000)
+    p.assign_decisions(deque())
+    ex.add_player(p)
+    investor = CountingValueInvestor("val_1", 1_000_000, 2_000)
+    ex.add_player(investor)
+
+    for _ in range(10):
+        ex.tick()
+    assert investor.n_decide == 0
+
+    # The price is low. Time to buy.
+    ex.final_price = 70
+    for _ in range(3):
+        ex.tick()
+    assert investor.n_decide == 3
+    assert len(ex.offers) == 1
@@ -0,0 +1,91 @@
+from exchange import Ex
+from player import Puppet
+from offer import Direction, Offer
+from deallog import NullDealLog
+
+import io
+import json
+from collections import deque
+
+
+def get_ex(instrument):
+    ex = Ex(deal_log=NullDealLog(), link_log=False, instrument=instrument)
+
+    for i in range(1,3):
+        p = Puppet(f"player_{i}", 1_000_000, 2_000)
+        p.assign_decisions(deque())
+        ex.add_player(p)
+
+    for _ in range(10):
+        ex.players["player_1"].decisions.append(
+            Offer("player_1", Direction.BUY, 10, 100.0)
+        )
+        ex.players["player_2"].decisions.append(
+            Offer("player_2", Direction.SELL, 5, 100.0)
+        )
+    return ex
+
+def test_stats():
+    ex = get_ex(True)
+
+    for _ in range(10):
+        ex.tick()
+    ex.deal()
+
+    # Cancel the offers left
+    ex.add_offers(list(ex.offers.values()))
+
+    snapshot = ex.stats_snapshot()
+    assert snapshot["calls"]["tick"] == 10
+    assert snapshot["counters"]["fills"] == 10
+    assert snapshot["counters"]["cancels"] == 5
+    assert snapshot["counters"]["offers"] == 25
+    assert snapshot["counters"]["levels_scanned"] > 0
+    assert snapshot["counters"]["bytes_logged"] == 0
+
+    for phase in ("tick", "add_offers", "best_offers", "deal", "deal_one_price", "deal_one_pair", "settle", "deal_log"):
+        assert snapshot["seconds"][phase] >= 0
+
+    f = io.StringIO()
+    ex.dump_stats(f)
+    assert json.loads(f.getvalue()) == snapshot
+
+def test_no_stats():
+    ex = get_ex(False)
+    ex.tick()
+    ex.deal()
+
+    assert ex.stats_snapshot() is None
+    # The plain methods, not wrapped
+    assert ex.tick.__func__ is Ex.tick
+
+class SizeDealLog(NullDealLog):
+    def write(self, tick, buyer, seller, n_stock, price):
+        return 10
+
+def test_stats_auction():
+    ex = get_ex(True)
+    ex.auction = True
+    for _ in range(10):
+        ex.tick()
+    ex.deal()
+
+    # One uncross, 10 fills at one price
+    snapshot = ex.stats_snapshot()
+    assert snapshot["calls"]["uncross"] == 1
+    assert snapshot["counters"]["fills"] == 10
+
+def test_stats_symbols():
+    ex = get_ex(True)
+    # Added after instrument. Its deal log is counted too.
+    ex.add_symbol("AAA", deal_log=SizeDealLog(), price=50)
+    ex.players["player_1"].decisions.appendleft(Offer("player_1", Direction.BUY, 4, 50.0, symbol="AAA"))
+    ex.players["player_2"].decisions.appendleft(Offer("player_2", Direction.SELL, 4, 50.0, symbol="AAA"))
+
+    for _ in range(11):
+        ex.tick()
+    ex.deal()
+
+    snapshot = ex.stats_snapshot()
+    assert snapshot["counters"]["fills"] == 11
+    assert snapshot["counters"]["bytes_logged"] == 10
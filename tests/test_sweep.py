@@ -0,0 +1,36 @@
+from sweep import grid, sweep
+from run import add_players
+from exchange import Ex
+from deallog import NullDealLog
+
+import pytest
+
+def test_grid():
+    assert grid({"b": [1, 2], "a": ["x"]}) == [{"a": "x", "b": 1}, {"a": "x", "b": 2}]
+    assert grid({}) == [{}]
+
+def test_add_players_params():
+    ex = Ex(deal_log=NullDealLog(), link_log=False)
+    add_players(ex, {"RandomWalker": 2, "ValueInvestor": 1}, {"ValueInvestor.lot": 100})
+    assert sorted(ex.players) == ["rand_1", "rand_2", "val_1"]
+    assert ex.players["val_1"].lot == 100
+    assert ex.players["rand_1"].high_price == 125
+
+    with pytest.raises(ValueError):
+        add_players(ex, {"RandomWalker": 1}, {"RandomWalker.no_such_thing": 1})
+
+def test_sweep_cache(tmp_path):
+    cache_dir = tmp_path / "cache"
+    population = {"RandomWalker": 5, "ValueInvestor": 1}
+
+    first = list(sweep({"RandomWalker.high_price": [110, 125]}, [population], [0], 50, cache_dir, 2))
+    assert [cached for _, _, cached in first] == [False, False]
+
+    # Extend the grid. Only the new point runs.
+    second = list(sweep({"RandomWalker.high_price": [110, 125, 140]}, [population], [0], 50, cache_dir, 2))
+    assert sorted(cached for _, _, cached in second) == [False, True, True]
+
+    summaries = {point["params"]["RandomWalker.high_price"]: summary for point, summary, _ in first}
+    for point, summary, cached in second:
+        if cached:
+            assert summary == summaries[point["params"]["RandomWalker.high_price"]]
@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 
+from deallog import is_binary, read_lines
+from query_log import query
+
 def main():
     info = []
 
@@ -15,15 +18,22 @@ def main():
     #target = "ID:trend_1"
     target = "ID:val_1"
 
-    with open('deal.log', 'r') as f:
-        for i, l in enumerate(f):
-            l = l.strip()
-            deal = l.split('\t')
+    if is_binary('deal.log'):
+        # Seek to the deals of the target by the side index
+        player_id = target[len("ID:"):]
+        for i, tick, _, side, money, n_stock, deal_n_stock, price in query('deal.log', [player_id]):
+            print(f'{i}\t${money:,.2f}\tN:{n_stock}\t{side}\t{deal_n_stock}\t{price}')
+        return
+
+    # Text deal log
+    for i, l in enumerate(read_lines('deal.log')):
+        l = l.strip()
+        deal = l.split('\t')
 
-            if deal[P1] == target:
-                print(f'{i}\t{deal[P1M]}\t{deal[P1S]}\tB\t{deal[N]}\t{deal[P]}')
-            if deal[P2] == target:
-                print(f'{i}\t{deal[P2M]}\t{deal[P2S]}\tS\t{deal[N]}\t{deal[P]}')
+        if deal[P1] == target:
+            print(f'{i}\t{deal[P1M]}\t{deal[P1S]}\tB\t{deal[N]}\t{deal[P]}')
+        if deal[P2] == target:
+            print(f'{i}\t{deal[P2M]}\t{deal[P2S]}\tS\t{deal[N]}\t{deal[P]}')
 
 if __name__ == "__main__":
     main()